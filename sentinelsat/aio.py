@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""Asynchronous client for the Sentinel Data Hub, based on asyncio and aiohttp.
+
+Requires Python 3.6+ and aiohttp.
+"""
+import asyncio
+import hashlib
+from datetime import datetime
+from os import remove
+from os.path import exists, getsize, join
+from urllib.parse import urljoin
+
+import aiohttp
+
+from sentinelsat.sentinel import (InvalidChecksumError, SentinelAPI, _decode_scihub_response, _get_entries,
+                                  _normalize_entry, _parse_product_info, _unique_products)
+
+
+class AsyncSentinelAPI(object):
+    """Asynchronous counterpart of SentinelAPI for use in asyncio applications.
+
+    Many queries and downloads can run concurrently on a single event loop. The results
+    are the same as the ones of SentinelAPI and errors of the DataHub raise SentinelAPIError.
+    Use it as an asynchronous context manager or call close() when done.
+
+    Parameters
+    ----------
+    user : string
+        username for DataHub
+    password : string
+        password for DataHub
+    api_url : string, optional
+        URL of the DataHub
+        defaults to 'https://scihub.copernicus.eu/apihub'
+    page_size : int, optional
+        Number of results requested per OpenSearch page, defaults to 100
+    max_concurrent_downloads : int or None, optional
+        Maximum number of products downloaded at the same time, defaults to 2
+        (the per-account limit of the DataHub). None disables the limit.
+    timeout : float, optional
+        Total timeout in seconds of each request, no timeout by default
+
+    Examples
+    --------
+    >>> async with AsyncSentinelAPI('user', 'password') as api:
+    ...     products = await api.query(get_coordinates('map.geojson'), initial_date='20151219')
+    ...     await asyncio.gather(*[api.download(product['id']) for product in products])
+    """
+
+    def __init__(self, user, password, api_url='https://scihub.copernicus.eu/apihub/', page_size=100,
+                 max_concurrent_downloads=2, timeout=None):
+        self.api_url = SentinelAPI._url_trail_slash(api_url)
+        self.page_size = page_size
+        self.max_concurrent_downloads = max_concurrent_downloads
+        self._auth = aiohttp.BasicAuth(user, password)
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        # created on first use, inside the event loop
+        self._session = None
+        self._download_slots = None
+
+    @property
+    def session(self):
+        """aiohttp.ClientSession shared by all requests"""
+        if self._session is None:
+            self._session = aiohttp.ClientSession(auth=self._auth, timeout=self._timeout)
+        return self._session
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    @property
+    def url(self):
+        return urljoin(self.api_url, 'search?format=json&rows=%d' % self.page_size)
+
+    async def query(self, area=None, point=None, initial_date=None, end_date=None, max_workers=4, **keywords):
+        """Query the SciHub API, see SentinelAPI.query(). Returns the list of products.
+
+        The end date defaults to the time of the call.
+        """
+        if end_date is None:
+            end_date = datetime.now()
+        query = SentinelAPI.format_query(area, point, initial_date, end_date, **keywords)
+        return await self.query_raw(query, max_workers)
+
+    async def query_raw(self, query, max_workers=4):
+        """Do a full-text query on the SciHub API and return the products of all result pages.
+
+        Once the first page has been loaded, the remaining pages are requested concurrently,
+        at most max_workers at a time.
+        """
+        products, total_results = await self.query_page(query)
+        # the DataHub may return fewer rows than requested, step by the size of the first page
+        page_rows = len(products)
+        if products:
+            slots = asyncio.Semaphore(max_workers)
+
+            async def query_rest(start):
+                entries = []
+                end = min(start + page_rows, total_results)
+                async with slots:
+                    # load the rest of a page which came back shorter, so that no results are skipped
+                    while start < end:
+                        page, _ = await self.query_page(query, start)
+                        if not page:
+                            break
+                        entries.extend(page)
+                        start += len(page)
+                return entries
+
+            pages = await asyncio.gather(*[query_rest(start) for start in range(page_rows, total_results, page_rows)])
+            for entries in pages:
+                products.extend(entries)
+        return _unique_products(products)
+
+    async def iter_products(self, query):
+        """Iterate asynchronously over the results of a full-text query page by page."""
+        start = 0
+        while True:
+            entries, total_results = await self.query_page(query, start)
+            for entry in entries:
+                yield entry
+            start += len(entries)
+            if not entries or start >= total_results:
+                break
+
+    async def query_page(self, query, start=0):
+        """Request a single page of OpenSearch results.
+
+        Returns the list of product entries of the page and the total number of results of the query.
+        """
+        async with self.session.post('%s&start=%d' % (self.url, start), data=dict(q=query)) as response:
+            feed = _decode_scihub_response(response.status, await response.read()).get('feed', {})
+        return [_normalize_entry(entry) for entry in _get_entries(feed)], int(feed.get('opensearch:totalResults', 0))
+
+    async def get_product_info(self, id):
+        """Access SciHub API to get info about a Product, see SentinelAPI.get_product_info()."""
+        url = urljoin(self.api_url, "odata/v1/Products('%s')/?$format=json" % id)
+        async with self.session.get(url) as response:
+            product_json = _decode_scihub_response(response.status, await response.read())
+        return _parse_product_info(product_json['d'], self.api_url)
+
+    async def download(self, id, directory_path='.', checksum=False):
+        """Download a product, streaming it to disk.
+
+        Incomplete downloads are continued and complete files are skipped, like in
+        SentinelAPI.download(). With checksum=True, the MD5 checksum is computed from the
+        received data and InvalidChecksumError is raised if it does not match. The corrupt file is removed.
+
+        Returns the path of the downloaded file and its product info.
+        """
+        product_info = await self.get_product_info(id)
+        path = join(directory_path, product_info['title'] + '.zip')
+        if exists(path) and getsize(path) == product_info['size']:
+            return path, product_info
+        if exists(path) and getsize(path) > product_info['size']:
+            remove(path)
+
+        if self.max_concurrent_downloads is None:
+            md5_digest = await self._download_file(product_info['url'], path)
+        else:
+            if self._download_slots is None:
+                self._download_slots = asyncio.Semaphore(self.max_concurrent_downloads)
+            async with self._download_slots:
+                md5_digest = await self._download_file(product_info['url'], path)
+        if checksum and md5_digest.lower() != product_info['md5'].lower():
+            # a full-size file would be taken as complete by the next attempt
+            remove(path)
+            raise InvalidChecksumError('File corrupt: checksums do not match')
+        return path, product_info
+
+    async def _download_file(self, url, path):
+        """Stream a file to disk, continuing an incomplete one. Returns the hex digest of its MD5 checksum."""
+        md5 = hashlib.md5()
+        offset = 0
+        if exists(path):
+            offset = getsize(path)
+            # hash the existing part in a thread, not to block the event loop
+            await asyncio.get_event_loop().run_in_executor(None, _update_md5, md5, path)
+
+        headers = {'Range': 'bytes=%d-' % offset} if offset > 0 else {}
+        async with self.session.get(url, headers=headers) as response:
+            if response.status >= 400:
+                # raises SentinelAPIError with the error message of the server
+                _decode_scihub_response(response.status, await response.read())
+            if offset > 0 and response.status != 206:
+                # The server sends the whole file, start over
+                md5 = hashlib.md5()
+                offset = 0
+            with open(path, 'ab' if offset > 0 else 'wb') as f:
+                async for chunk in response.content.iter_chunked(2 ** 16):
+                    f.write(chunk)
+                    md5.update(chunk)
+        return md5.hexdigest()
+
+
+def _update_md5(md5, path, block_size=2 ** 20):
+    """Update an MD5 hash object with the content of a file."""
+    with open(path, 'rb') as f:
+        for block_data in iter(lambda: f.read(block_size), b''):
+            md5.update(block_data)
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import json
+import sqlite3
+import threading
+import time
+
+
+class ProductInfoCache(object):
+    """On-disk cache of product information, keyed by the product UUID.
+
+    Stores the dictionaries returned by SentinelAPI.get_product_info() in a SQLite database.
+    Product metadata does not change on the server, so entries only expire if a time to live is set.
+
+    Parameters
+    ----------
+    path : string, optional
+        Path of the SQLite database file, defaults to an in-memory database
+    ttl : float, optional
+        Time in seconds after which an entry is discarded. Entries never expire by default.
+    max_entries : int, optional
+        Maximum number of entries. The least recently used entries are evicted when it
+        is exceeded. Unlimited by default.
+
+    Examples
+    --------
+    >>> api = SentinelAPI('user', 'password', cache=ProductInfoCache('products.sqlite'))
+    """
+
+    def __init__(self, path=':memory:', ttl=None, max_entries=None):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # the cache is shared by the threads of parallel downloads
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS products ('
+                'id TEXT PRIMARY KEY, info TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)')
+
+    def get(self, id):
+        """Return the cached product info of a product or None if it is not cached or expired."""
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute('SELECT info, created FROM products WHERE id = ?', (id,)).fetchone()
+            if row is None:
+                return None
+            info, created = row
+            if self.ttl is not None and now - created > self.ttl:
+                self._connection.execute('DELETE FROM products WHERE id = ?', (id,))
+                return None
+            self._connection.execute('UPDATE products SET accessed = ? WHERE id = ?', (now, id))
+        return json.loads(info)
+
+    def set(self, product_info):
+        """Add the product info returned by get_product_info() to the cache."""
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO products (id, info, created, accessed) VALUES (?, ?, ?, ?)',
+                (product_info['id'], json.dumps(product_info), now, now))
+            if self.max_entries is not None:
+                self._connection.execute(
+                    'DELETE FROM products WHERE id NOT IN '
+                    '(SELECT id FROM products ORDER BY accessed DESC LIMIT ?)', (self.max_entries,))
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM products')
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+
+    def close(self):
+        self._connection.close()
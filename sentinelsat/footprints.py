@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""Batched parsing of the WKT footprints of products and streamed GeoJSON output.
+
+The coordinates of many footprints are parsed at once into NumPy arrays if NumPy is installed.
+NumPy is imported on first use.
+"""
+import heapq
+import json
+import re
+
+np = None
+_numpy_loaded = False
+
+_PARENS = re.compile(r'[()]')
+
+
+def _load_numpy():
+    """Import NumPy on first use into the np global, which stays None if it is not installed."""
+    global np, _numpy_loaded
+    if not _numpy_loaded:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            pass
+        _numpy_loaded = True
+    return np
+
+
+def parse_footprints(wkts):
+    """Parse many POLYGON or MULTIPOLYGON WKT footprints at once.
+
+    The structure of each footprint is read from its parentheses, then the coordinates of
+    all rings of all footprints are converted to floats in a single pass.
+
+    Parameters
+    ----------
+    wkts : list of string
+        WKT footprints, e.g. 'POLYGON ((0 0,1 0,1 1,0 0))'
+
+    Returns
+    -------
+    list
+        For each footprint the list of its polygons. Each polygon is a list of rings, the exterior
+        ring followed by the holes. Each ring is a (n, 2) array of (lon, lat) coordinates, or a list
+        of [lon, lat] lists if NumPy is not installed.
+
+    Raises
+    ------
+    ValueError
+        If a footprint is not a POLYGON or MULTIPOLYGON with two dimensional coordinates
+    """
+    _load_numpy()
+    structure = [_split_rings(wkt) for wkt in wkts]
+    rings = _parse_rings([ring for polygons in structure for polygon in polygons for ring in polygon])
+    parsed_rings = iter(rings)
+    return [[[next(parsed_rings) for _ in polygon] for polygon in polygons] for polygons in structure]
+
+
+def footprint_geometry(polygons):
+    """Return the GeoJSON Polygon or MultiPolygon geometry of a footprint parsed by parse_footprints()."""
+    _load_numpy()
+    coordinates = [[_ring_coordinates(ring) for ring in polygon] for polygon in polygons]
+    if len(coordinates) == 1:
+        return {'type': 'Polygon', 'coordinates': coordinates[0]}
+    return {'type': 'MultiPolygon', 'coordinates': coordinates}
+
+
+def write_feature_collection(features, fileobj):
+    """Write GeoJSON Features to a file object as a FeatureCollection, one Feature at a time.
+
+    Parameters
+    ----------
+    features : iterable of dict
+        GeoJSON Features, e.g. a generator
+    fileobj : file object
+        Text file open for writing
+    """
+    fileobj.write('{"type": "FeatureCollection", "features": [')
+    for i, feature in enumerate(features):
+        if i > 0:
+            fileobj.write(', ')
+        fileobj.write(json.dumps(feature))
+    fileobj.write(']}\n')
+
+
+def _split_rings(wkt):
+    """Split a POLYGON or MULTIPOLYGON WKT string into the texts of its rings, grouped by polygon."""
+    kind = wkt.lstrip()[:12].upper()
+    if kind.startswith('MULTIPOLYGON'):
+        ring_depth = 3
+    elif kind.startswith('POLYGON'):
+        ring_depth = 2
+    else:
+        raise ValueError("Footprint must be a POLYGON or MULTIPOLYGON: %s" % wkt[:50])
+    polygons = []
+    depth = 0
+    start = 0
+    for match in _PARENS.finditer(wkt):
+        if match.group() == '(':
+            depth += 1
+            if depth == ring_depth - 1:
+                polygons.append([])
+            elif depth == ring_depth:
+                start = match.end()
+        else:
+            if depth == ring_depth:
+                polygons[-1].append(wkt[start:match.start()])
+            depth -= 1
+    return polygons
+
+
+def _parse_rings(rings):
+    """Convert the texts of rings to coordinate arrays."""
+    if not rings:
+        return []
+    sizes = [ring.count(',') + 1 for ring in rings]
+    if np is None:
+        parsed = [[[float(value) for value in point.split()] for point in ring.split(',')] for ring in rings]
+        if any(len(point) != 2 for ring in parsed for point in ring):
+            raise ValueError("Footprints must have two dimensional coordinates.")
+        return parsed
+    values = np.fromstring(' '.join(rings).replace(',', ' '), sep=' ')
+    if len(values) != 2 * sum(sizes):
+        raise ValueError("Footprints must have two dimensional coordinates.")
+    return np.split(values.reshape(-1, 2), np.cumsum(sizes)[:-1])
+
+
+def _ring_coordinates(ring):
+    return ring.tolist() if np is not None else ring
+
+
+def coverage_fractions(footprints, area, resolution=100):
+    """Compute which fraction of an area each footprint covers.
+
+    The area is sampled with a regular grid of points, weighted by the cosine of their latitude
+    to account for the convergence of the meridians. The points inside each footprint are found with
+    a vectorized point in polygon test, after a bounding box test discarding distant footprints.
+    The precision is thus about 1 / resolution. Requires NumPy.
+
+    Parameters
+    ----------
+    footprints : list
+        Footprints parsed by parse_footprints()
+    area : string or tuple or dict
+        Either the coordinates returned by get_coordinates(), a POLYGON or MULTIPOLYGON WKT string,
+        a (min_lon, min_lat, max_lon, max_lat) bounding box or a GeoJSON Polygon or
+        MultiPolygon geometry, or a Feature containing one
+    resolution : int, optional
+        Number of sample points along the longer side of the bounding box of the area, defaults to 100
+
+    Returns
+    -------
+    numpy.ndarray
+        Fraction of the area between 0 and 1 covered by each footprint
+    """
+    assert _load_numpy() is not None, "numpy must be installed to compute the coverage of footprints."
+    xs, ys, weights = _sample_area(area, resolution)
+    total = weights.sum()
+    fractions = np.zeros(len(footprints))
+    if total == 0:
+        return fractions
+    for i, polygons in enumerate(footprints):
+        inside = _points_in_footprint(xs, ys, polygons)
+        if inside is not None:
+            fractions[i] = weights[inside].sum() / total
+    return fractions
+
+
+def greedy_cover(footprints, area, costs=None, tolerance=0.01, resolution=100):
+    """Select a small set of footprints covering an area with a greedy weighted set cover.
+
+    The area is sampled like in coverage_fractions(). Each step selects the footprint covering the
+    largest part of the remaining area per unit of cost, until less than the tolerance is left
+    uncovered or no footprint covers any more of it. The coverage of the candidates is updated
+    lazily, since it can only shrink as more footprints are selected. Requires NumPy.
+
+    Parameters
+    ----------
+    footprints : list
+        Footprints parsed by parse_footprints()
+    area : string or tuple or dict
+        Area to cover, see coverage_fractions()
+    costs : list of float, optional
+        Positive cost of each footprint, e.g. its size. All footprints cost the same by default,
+        in which case the number of footprints is minimized.
+    tolerance : float, optional
+        Fraction of the area which may be left uncovered, defaults to 0.01
+    resolution : int, optional
+        Number of sample points along the longer side of the bounding box of the area, defaults to 100
+
+    Returns
+    -------
+    list of int
+        Indices of the selected footprints, in the order of their selection
+    """
+    assert _load_numpy() is not None, "numpy must be installed to select covering footprints."
+    xs, ys, weights = _sample_area(area, resolution)
+    if costs is None:
+        costs = [1.] * len(footprints)
+    covered = np.zeros(len(xs), dtype=bool)
+    remaining = weights.sum()
+    points = {}
+    heap = []
+    for i, polygons in enumerate(footprints):
+        inside = _points_in_footprint(xs, ys, polygons)
+        if inside is not None:
+            points[i] = inside
+            heapq.heappush(heap, (-weights[inside].sum() / costs[i], i))
+
+    selected = []
+    while heap and remaining > tolerance * weights.sum():
+        _, i = heapq.heappop(heap)
+        inside = points[i] = points[i][~covered[points[i]]]
+        gain = weights[inside].sum()
+        if gain <= 0:
+            continue
+        ratio = -gain / costs[i]
+        if heap and ratio > heap[0][0]:
+            # another footprint might gain more now, look at it first
+            heapq.heappush(heap, (ratio, i))
+            continue
+        covered[inside] = True
+        remaining -= gain
+        selected.append(i)
+    return selected
+
+
+def _area_rings(area):
+    """Return the polygons of an area as lists of (n, 2) coordinate arrays."""
+    if not isinstance(area, (tuple, list, dict)):
+        if not area.lstrip()[:1].isalpha():
+            # coordinates returned by get_coordinates()
+            area = 'POLYGON((%s))' % area
+        return parse_footprints([area])[0]
+    # imported here, the tile index is only needed for this conversion
+    from sentinelsat.tiles import _area_polygons
+    return [[np.array(ring, dtype=float) for ring in polygon] for polygon in _area_polygons(area)]
+
+
+def _sample_area(area, resolution):
+    """Return the coordinates and weights of a grid of sample points inside an area."""
+    polygons = _area_rings(area)
+    coords = np.concatenate([polygon[0] for polygon in polygons])
+    min_x, min_y = coords.min(axis=0)
+    max_x, max_y = coords.max(axis=0)
+    step = max(max_x - min_x, max_y - min_y) / resolution
+    if step == 0:
+        return np.zeros(0), np.zeros(0), np.zeros(0)
+    # centers of the grid cells
+    grid_x = np.arange(min_x + step / 2, max_x, step)
+    grid_y = np.arange(min_y + step / 2, max_y, step)
+    xs, ys = [a.ravel() for a in np.meshgrid(grid_x, grid_y)]
+    inside = _points_in_footprint(xs, ys, polygons)
+    if inside is None:
+        return np.zeros(0), np.zeros(0), np.zeros(0)
+    xs, ys = xs[inside], ys[inside]
+    return xs, ys, np.cos(np.radians(ys))
+
+
+def _points_in_footprint(xs, ys, polygons):
+    """Indices of the points inside any polygon of a footprint, None if its bounding box excludes all points."""
+    coords = np.concatenate([polygon[0] for polygon in polygons])
+    min_x, min_y = coords.min(axis=0)
+    max_x, max_y = coords.max(axis=0)
+    candidates = np.nonzero((xs >= min_x) & (xs <= max_x) & (ys >= min_y) & (ys <= max_y))[0]
+    if len(candidates) == 0:
+        return None
+    cxs, cys = xs[candidates], ys[candidates]
+    inside = np.zeros(len(candidates), dtype=bool)
+    for polygon in polygons:
+        inside |= _points_in_polygon(cxs, cys, polygon)
+    return candidates[inside]
+
+
+def _points_in_polygon(xs, ys, polygon):
+    """Even-odd rule test of many points against a polygon given as a list of rings.
+
+    All edges of a ring are tested against all points at once.
+    """
+    inside = np.zeros(len(xs), dtype=bool)
+    for ring in polygon:
+        x1, y1 = ring[:, 0, None], ring[:, 1, None]
+        x2, y2 = np.roll(x1, -1, axis=0), np.roll(y1, -1, axis=0)
+        # horizontal edges never cross, their division by zero is masked out
+        with np.errstate(divide='ignore', invalid='ignore'):
+            crosses = ((y1 > ys) != (y2 > ys)) & (xs < x1 + (ys - y1) * (x2 - x1) / (y2 - y1))
+        inside ^= np.logical_xor.reduce(crosses, axis=0)
+    return inside
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import json
+import sqlite3
+import threading
+import time
+
+
+class DownloadInventory(object):
+    """SQLite index of the products downloaded to disk.
+
+    Records the path, size, MD5 checksum and product info of each completely downloaded product.
+    SentinelAPI.download_all() looks up all products of a query at once and skips those which
+    are complete, without contacting the DataHub or checking the files on disk.
+
+    Parameters
+    ----------
+    path : string, optional
+        Path of the SQLite database file, defaults to an in-memory database
+
+    Examples
+    --------
+    >>> api = SentinelAPI('user', 'password', inventory=DownloadInventory('downloads.sqlite'))
+    """
+
+    # maximum number of SQL variables per statement supported by older SQLite versions
+    _chunk_size = 500
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        # the inventory is shared by the threads of parallel downloads
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS downloads ('
+                'id TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL, md5 TEXT, '
+                'verified INTEGER NOT NULL, product_info TEXT NOT NULL, updated REAL NOT NULL)')
+
+    def add(self, path, product_info, verified=False):
+        """Record a completely downloaded product.
+
+        Parameters
+        ----------
+        path : string
+            Path of the downloaded file
+        product_info : dict
+            Product info returned by get_product_info()
+        verified : bool, optional
+            Whether the MD5 checksum of the file has been verified
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO downloads (id, path, size, md5, verified, product_info, updated) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (product_info['id'], path, product_info['size'], product_info.get('md5'), int(verified),
+                 json.dumps(product_info), time.time()))
+
+    def remove(self, id):
+        """Remove a product from the inventory, e.g. after its file was deleted."""
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM downloads WHERE id = ?', (id,))
+
+    def get(self, id):
+        """Return the (path, product_info, verified) of a downloaded product or None."""
+        return self.get_many([id]).get(id)
+
+    def get_many(self, ids):
+        """Look up many products at once.
+
+        Returns
+        -------
+        dict[string, tuple]
+            Maps the id of each downloaded product to its (path, product_info, verified).
+            Products which are not in the inventory are left out.
+        """
+        ids = list(ids)
+        result = {}
+        with self._lock:
+            for i in range(0, len(ids), self._chunk_size):
+                chunk = ids[i:i + self._chunk_size]
+                rows = self._connection.execute(
+                    'SELECT id, path, product_info, verified FROM downloads WHERE id IN (%s)' %
+                    ','.join('?' * len(chunk)), chunk)
+                for id, path, product_info, verified in rows:
+                    result[id] = (path, json.loads(product_info), bool(verified))
+        return result
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM downloads').fetchone()[0]
+
+    def close(self):
+        self._connection.close()
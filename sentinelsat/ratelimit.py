@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from contextlib import contextmanager
+
+
+class RateLimiter(object):
+    """Client-side limits on the requests sent to the DataHub.
+
+    The DataHub limits the number of requests per user and of concurrent downloads per account and
+    blocks clients exceeding them. A RateLimiter keeps searches and OData requests below a rate with
+    a token bucket and the number of download connections below a limit. Share one instance between
+    all SentinelAPI objects of a process using the same account.
+
+    Parameters
+    ----------
+    requests_per_second : float, optional
+        Sustained rate of searches and product info requests. Unlimited by default.
+    burst : int, optional
+        Number of requests which may be sent at once after a pause, defaults to 1
+    max_concurrent_downloads : int or None, optional
+        Maximum number of connections downloading products at the same time, defaults to 2
+        (the per-account limit of the DataHub). A segmented download uses one connection per
+        segment. None disables the limit.
+
+    Examples
+    --------
+    >>> limiter = RateLimiter(requests_per_second=2, max_concurrent_downloads=2)
+    >>> api = SentinelAPI('user', 'password', rate_limiter=limiter)
+    """
+
+    def __init__(self, requests_per_second=None, burst=1, max_concurrent_downloads=2):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.max_concurrent_downloads = max_concurrent_downloads
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = time.time()
+        self._download_connections = 0
+        self._download_condition = threading.Condition()
+
+    def acquire(self):
+        """Wait until a request may be sent.
+
+        Each caller reserves a token, possibly ahead of time, and sleeps until the token is due.
+        Waiting callers are thus served in order and the rate is reached without bursts above it.
+        """
+        if self.requests_per_second is None:
+            return
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.requests_per_second)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.requests_per_second
+        if wait > 0:
+            time.sleep(wait)
+
+    @contextmanager
+    def download_slot(self, connections=1):
+        """Context manager holding the given number of download connections while a file is downloaded.
+
+        All connections of a download are taken at once, so that parallel segmented downloads
+        can not block each other while holding part of them.
+
+        Raises
+        ------
+        ValueError
+            If more connections are requested than max_concurrent_downloads
+        """
+        limit = self.max_concurrent_downloads
+        if limit is not None and connections > limit:
+            raise ValueError("A download with %d segments exceeds max_concurrent_downloads=%d"
+                             % (connections, limit))
+        with self._download_condition:
+            while limit is not None and self._download_connections + connections > limit:
+                self._download_condition.wait()
+            self._download_connections += connections
+        try:
+            yield
+        finally:
+            with self._download_condition:
+                self._download_connections -= connections
+                self._download_condition.notify_all()
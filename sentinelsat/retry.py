@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+import random
+import time
+from email.utils import mktime_tz, parsedate_tz
+
+import requests
+
+
+class RetryPolicy(object):
+    """Retry policy with exponential backoff and jitter for requests to the DataHub.
+
+    Only transient errors are retried: connection errors, timeouts and the HTTP status codes in
+    retry_statuses, like 429 Too Many Requests and 503 Service Unavailable. Downloads, which fail
+    for many more reasons, are retried on all errors except permanent client errors.
+
+    The Retry-After header of the server is honoured. Otherwise the delay doubles with every
+    attempt and is drawn at random between zero and that value ("full jitter"), so that parallel
+    workers do not retry in lockstep.
+
+    Parameters
+    ----------
+    max_attempts : int, optional
+        Maximum number of attempts, defaults to 5
+    backoff : float, optional
+        Delay in seconds before the first retry, defaults to 2
+    max_backoff : float, optional
+        Maximum delay in seconds between two attempts, defaults to 300
+    max_total_wait : float, optional
+        Maximum time in seconds spent waiting in total for one call, defaults to 1200
+    jitter : bool, optional
+        Whether the delays are randomized, defaults to True
+    retry_statuses : tuple of int, optional
+        HTTP status codes which are retried, defaults to (429, 502, 503, 504)
+    """
+
+    def __init__(self, max_attempts=5, backoff=2., max_backoff=300., max_total_wait=1200., jitter=True,
+                 retry_statuses=(429, 502, 503, 504)):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_total_wait = max_total_wait
+        self.jitter = jitter
+        self.retry_statuses = retry_statuses
+
+    def is_retryable(self, error):
+        """Whether an error is transient and the failed request should be retried."""
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return True
+        status = _http_status(error)
+        return status is not None and status in self.retry_statuses
+
+    def is_permanent(self, error):
+        """Whether an error is a client error, like HTTP 401 or 404, which repeating the request can not fix."""
+        status = _http_status(error)
+        return status is not None and 400 <= status < 500 and status not in self.retry_statuses
+
+    def delay(self, attempt, error=None):
+        """Seconds to wait before the retry following the given failed attempt, counted from 0."""
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def call(self, func, *args, **kwargs):
+        """Call func(*args, **kwargs), retrying it on transient errors.
+
+        The last error is raised if it is not transient, the attempts are exhausted
+        or waiting for the next attempt would exceed max_total_wait.
+        """
+        total_wait = 0
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not self.is_retryable(e) or attempt + 1 >= self.max_attempts:
+                    raise
+                delay = self.delay(attempt, e)
+                if total_wait + delay > self.max_total_wait:
+                    raise
+                print("Request failed:\n{}\nTrying again in {:.0f} seconds.".format(str(e), delay))
+                time.sleep(delay)
+                total_wait += delay
+                attempt += 1
+
+
+def _http_status(error):
+    """HTTP status code of a SentinelAPIError or requests.HTTPError, None for other errors."""
+    status = getattr(error, 'http_status', None)
+    if status is None and getattr(error, 'response', None) is not None:
+        status = error.response.status_code
+    return status
+
+
+def _retry_after(error):
+    """Seconds to wait according to the Retry-After header of the failed response, if any."""
+    headers = getattr(error, 'headers', None)
+    if headers is None and getattr(error, 'response', None) is not None:
+        headers = error.response.headers
+    if not headers or headers.get('Retry-After') is None:
+        return None
+    value = headers['Retry-After']
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        date = parsedate_tz(value)
+        if date is None:
+            return None
+        return max(mktime_tz(date) - time.time(), 0)
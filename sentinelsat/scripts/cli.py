@@ -1,9 +1,22 @@
 import click
-import geojson as gj
 
+import functools
+import glob
 import os
 
-from sentinelsat.sentinel import SentinelAPI, get_coordinates
+from sentinelsat.sentinel import InvalidChecksumError, SentinelAPI, get_coordinates, verify_checksums
+
+
+def _write_report(path, corrupt, missing, unknown=()):
+    """Print the corrupt, missing and unknown files and write them to corrupt_scenes.txt in path."""
+    if not corrupt and not missing and not unknown:
+        click.echo('All files are valid.')
+        return
+    with open(os.path.join(path, "corrupt_scenes.txt"), "w") as outfile:
+        for status, files in (('corrupt', corrupt), ('missing', missing), ('unknown', unknown)):
+            for file_path in files:
+                click.echo('%s : %s' % (status, file_path))
+                outfile.write("%s : %s\n" % (status, file_path))
 
 
 @click.group()
@@ -50,7 +63,7 @@ def cli():
         """)
 @click.option(
     '--md5', is_flag=True,
-    help="""Verify the MD5 checksum and write corrupt product ids and filenames
+    help="""Verify the MD5 checksum and write corrupt and missing files
     to corrupt_scenes.txt.
     """)
 @click.option(
@@ -62,9 +75,23 @@ def cli():
 @click.option(
     '-c', '--cloud', type=int,
     help='Maximum cloud cover in percent. (Automatically sets --sentinel2)')
+@click.option(
+    '--workers', type=int, default=1,
+    help='Number of products downloaded in parallel.')
+@click.option(
+    '--incremental', type=click.Path(dir_okay=False), default=None,
+    help="""Only return products ingested since the last run with the same
+    options. The state is kept in the given JSON file. With --download, it is
+    only updated once all products have been downloaded.
+    """)
+@click.option(
+    '--coverage', type=click.FloatRange(0, 100), default=None,
+    help="""Minimum percentage of the --geojson area covered by a product.
+    Products covering less are dropped. Requires NumPy.
+    """)
 def search(
         user, password, tile, geojson, start, end, download, md5,
-        sentinel1, sentinel2, cloud, footprints, path, query, url):
+        sentinel1, sentinel2, cloud, footprints, path, query, url, workers, incremental, coverage):
     """Search for Sentinel products and, optionally, download all the results
     and/or create a geojson file with the search result footprints.
     Beyond your SciHub user and password, you must pass a geojson file
@@ -86,33 +113,47 @@ def search(
     if query is not None:
         search_kwargs.update(dict([i.split('=') for i in query.split(',')]))
 
+    if incremental:
+        run_query = functools.partial(api.query_incremental, incremental, commit=False)
+    else:
+        run_query = api.query
     if tile:
-        api.query(point = get_coordinates(tile = tile), initial_date = start, end_date = end, **search_kwargs)
+        run_query(point = get_coordinates(tile = tile), initial_date = start, end_date = end, **search_kwargs)
     elif geojson:
-        api.query(area = get_coordinates(geojson_file = geojson), initial_date = start, end_date = end, **search_kwargs)
+        area = get_coordinates(geojson_file = geojson)
+        run_query(area = area, initial_date = start, end_date = end, **search_kwargs)
+        if coverage:
+            api.filter_products(area, min_coverage=coverage / 100.)
     else:
         raise ValueError("Either a --geojson or --tile arguments must be given.")
     
     if footprints is True:
-        footprints_geojson = api.get_footprints()
-        with open(os.path.join(path, "search_footprints.geojson"), "w") as outfile:
-            outfile.write(gj.dumps(footprints_geojson))
+        api.write_footprints(os.path.join(path, "search_footprints.geojson"))
 
     if download is True:
-        result = api.download_all(path, checksum=md5)
+        result = api.download_all(path, checksum=md5, max_workers=workers)
         if md5 is True:
-            corrupt_scenes = [(path, info["id"]) for path, info in result.items() if info is not None]
-            if len(corrupt_scenes) > 0:
-                with open(os.path.join(path, "corrupt_scenes.txt"), "w") as outfile:
-                    for corrupt_tuple in corrupt_scenes:
-                        outfile.write("%s : %s\n" % corrupt_tuple)
+            # downloads are verified while downloading and corrupt files are removed,
+            # the failures are told apart by their last error
+            failed = api.failed_downloads
+            _write_report(
+                path,
+                sorted(file_path for file_path, error in failed.items()
+                       if isinstance(error, InvalidChecksumError)),
+                sorted(file_path for file_path, error in failed.items()
+                       if not isinstance(error, InvalidChecksumError)))
+        if incremental and all(info is not None for info in result.values()):
+            api.commit_incremental()
     else:
-        for product in api.get_products():
+        products = api.get_products()
+        for product in products:
             print('Product %s - %s' % (product['id'], product['summary']))
         print('---')
         print(
             '%s scenes found with a total size of %.2f GB' %
-            (len(api.get_products()), api.get_products_size()))
+            (len(products), api.get_products_size()))
+        if incremental:
+            api.commit_incremental()
 
 
 @cli.command()
@@ -138,3 +179,29 @@ def download(user, password, productid, path, md5, url):
     """
     api = SentinelAPI(user, password, url)
     api.download(productid, path, md5)
+
+
+@cli.command()
+@click.argument('user', type=str, metavar='<user>')
+@click.argument('password', type=str, metavar='<password>')
+@click.argument('directory', type=click.Path(exists=True, file_okay=False), metavar='<directory>')
+@click.option(
+    '--url', '-u', type=str, default='https://scihub.copernicus.eu/apihub/',
+    help="""Define another API URL. Default URL is
+        'https://scihub.copernicus.eu/apihub/'.
+        """)
+@click.option(
+    '--workers', type=int, default=None,
+    help='Number of files checked in parallel. Defaults to the number of CPUs.')
+def verify(user, password, directory, url, workers):
+    """Verify the MD5 checksums of the downloaded products in a directory.
+    The checksums of the .zip files are looked up on the server by their
+    file name. Corrupt files and files without a matching product on the
+    server ("unknown") are written to corrupt_scenes.txt.
+    """
+    api = SentinelAPI(user, password, url)
+    paths = sorted(glob.glob(os.path.join(directory, '*.zip')))
+    checksums = api.get_checksums(paths)
+    corrupt, missing = verify_checksums(checksums, max_workers=workers)
+    unknown = [file_path for file_path in paths if file_path not in checksums]
+    _write_report(directory, corrupt, missing, unknown)
@@ -2,46 +2,56 @@
 from __future__ import print_function
 
 import hashlib
+import importlib
+import json
 import sys
+import threading
 import traceback
 import xml.etree.ElementTree as ET
 from datetime import date, datetime, timedelta
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
 from os import remove
-from os.path import join, exists, getsize, dirname, realpath
-import pycurl
+from os.path import basename, join, exists, getsize, splitext
 from time import sleep
 
-import geojson
-import homura
-import html2text
 import requests
-from tqdm import tqdm
+from requests.adapters import HTTPAdapter
+
+from sentinelsat.footprints import (coverage_fractions, footprint_geometry, greedy_cover, parse_footprints,
+                                    write_feature_collection)
+from sentinelsat.ratelimit import RateLimiter
+from sentinelsat.retry import RetryPolicy
+from sentinelsat.tiles import get_tile_centroids
 
 try:
     from urlparse import urljoin
 except ImportError:
     from urllib.parse import urljoin
 
-try:
-    import certifi
-except ImportError:
-    certifi = None
-    
-try:
-    import pandas as pd
-    hasPandas = True
-except ImportError:
-    hasPandas = False
+# pandas, pycurl, homura, html2text, geojson, tqdm and the optional dependencies are imported
+# in the functions using them, which keeps importing this module and starting the CLI fast
+
+SEGMENTS_SUFFIX = '.segments'
+
+
+def _import_optional(name):
+    """Import an optional dependency on first use, return None if it is not installed."""
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
 
 
 class SentinelAPIError(Exception):
     """Invalid responses from SciHub.
     """
-    def __init__(self, http_status=None, code=None, msg=None, response_body=None):
+    def __init__(self, http_status=None, code=None, msg=None, response_body=None, headers=None):
         self.http_status = http_status
         self.code = code
         self.msg = msg
         self.response_body = response_body
+        self.headers = headers
 
     def __str__(self):
         return '(HTTP status: {0}, code: {1}) {2}'.format(
@@ -69,6 +79,15 @@ def format_date(in_date):
             return in_date
 
 
+def _parse_date(in_date):
+    """Convert date or datetime input or a YYYYMMDD string input to a datetime."""
+    if isinstance(in_date, datetime):
+        return in_date
+    elif isinstance(in_date, date):
+        return datetime(in_date.year, in_date.month, in_date.day)
+    return datetime.strptime(in_date, '%Y%m%d')
+
+
 def convert_timestamp(in_date):
     """Convert the timestamp received from Products API, to
     YYYY-MM-DDThh:mm:ssZ string format.
@@ -78,32 +97,221 @@ def convert_timestamp(in_date):
 
 
 def _check_scihub_response(response):
-    """Check that the response from server has status code 2xx and that the response is valid JSON."""
+    """Check that the response from server has status code 2xx and that the response is valid JSON.
+
+    Returns the decoded JSON content, so that it does not need to be decoded again.
+    """
+    return _decode_scihub_response(response.status_code, response.content, response.headers)
+
+
+def _decode_scihub_response(status_code, content, headers=None):
+    """Decode the JSON content of a response, see _check_scihub_response().
+
+    Raises SentinelAPIError with the error message of the server if the status code
+    is not 2xx or the content is not valid JSON.
+    """
+    text = content.decode('utf-8', 'replace')
     try:
-        response.raise_for_status()
-        response.json()
-    except (requests.HTTPError, ValueError) as e:
+        if status_code >= 400:
+            raise ValueError('HTTP status %d' % status_code)
+        return json.loads(text)
+    except ValueError as e:
         msg = "API response not valid. JSON decoding failed."
         code = None
         try:
-            msg = response.json()['error']['message']['value']
-            code = response.json()['error']['code']
+            error = json.loads(text)['error']
+            msg = error['message']['value']
+            code = error['code']
         except:
-            if not response.text.rstrip().startswith('{'):
+            if not text.rstrip().startswith('{'):
                 try:
+                    import html2text
                     h = html2text.HTML2Text()
                     h.ignore_images = True
                     h.ignore_anchors = True
-                    msg = h.handle(response.text).strip()
+                    msg = h.handle(text).strip()
                 except:
                     pass
-        api_error = SentinelAPIError(response.status_code, code, msg, response.content)
+        api_error = SentinelAPIError(status_code, code, msg, content, headers)
         # Suppress "During handling of the above exception..." message
         # See PEP 409
         api_error.__cause__ = None
         raise api_error
 
 
+def _parse_product_info(product, api_url):
+    """Convert the OData entity of a product into the dict returned by get_product_info()."""
+    # parse the GML footprint to same format as returned
+    # by .get_coordinates()
+    geometry_xml = ET.fromstring(product["ContentGeometry"])
+    poly_coords = geometry_xml \
+        .find('{http://www.opengis.net/gml}outerBoundaryIs') \
+        .find('{http://www.opengis.net/gml}LinearRing') \
+        .findtext('{http://www.opengis.net/gml}coordinates')
+    coord_string = ",".join(
+        [" ".join(double_coord[::-1]) for double_coord in [coord.split(",") for coord in poly_coords.split(" ")]]
+    )
+
+    keys = ['id', 'title', 'size', 'md5', 'date', 'footprint', 'url']
+    values = [
+        product['Id'],
+        product['Name'],
+        int(product['ContentLength']),
+        product['Checksum']['Value'],
+        convert_timestamp(product['ContentDate']['Start']),
+        coord_string,
+        urljoin(api_url, "odata/v1/Products('%s')/$value" % product['Id'])
+    ]
+    return dict(zip(keys, values))
+
+
+def _get_entries(feed):
+    """Return the list of product entries of an OpenSearch result feed."""
+    entries = feed.get('entry', [])
+    # this verification is necessary because if the query returns only
+    # one product, the entry will be a dict not a list
+    if isinstance(entries, dict):
+        return [entries]
+    return entries
+
+
+def _normalize_entry(entry):
+    """Make sure that the link and typed attribute groups of a product entry are lists.
+
+    The DataHub returns a group with a single item as a dict instead of a list.
+    """
+    for key in ('link', 'str', 'date', 'int', 'double', 'bool'):
+        if isinstance(entry.get(key), dict):
+            entry[key] = [entry[key]]
+    return entry
+
+
+def _iter_feed_entries(fileobj, feed):
+    """Parse an OpenSearch JSON response incrementally and yield its product entries one at a time.
+
+    The other values of the feed, e.g. opensearch:totalResults, are collected in the feed dict.
+    Like _get_entries(), this supports a single entry returned as a dict instead of a list.
+    """
+    import ijson
+    events = ijson.parse(fileobj, use_float=True)
+    for prefix, event, value in events:
+        if prefix in ('feed.entry', 'feed.entry.item') and event == 'start_map':
+            yield _normalize_entry(_build_json_object(events))
+        elif prefix.count('.') == 1 and prefix.startswith('feed.') and event in ('string', 'number'):
+            feed[prefix[len('feed.'):]] = value
+
+
+def _build_json_object(events):
+    """Build the JSON object whose start_map event was just read from the ijson events."""
+    import ijson
+    builder = ijson.ObjectBuilder()
+    builder.event('start_map', None)
+    depth = 1
+    for _, event, value in events:
+        builder.event(event, value)
+        if event in ('start_map', 'start_array'):
+            depth += 1
+        elif event in ('end_map', 'end_array'):
+            depth -= 1
+            if depth == 0:
+                return builder.value
+
+
+def _size_in_bytes(size):
+    """Convert a size string of the DataHub, e.g. '1.5 GB', to a number of bytes."""
+    value, unit = size.split(" ")
+    return int(round(float(value) * 1024 ** ['B', 'KB', 'MB', 'GB', 'TB'].index(unit)))
+
+
+def _product_costs(records, cost):
+    """Costs of the products for select_covering_products()."""
+    if cost is None:
+        return None
+    if callable(cost):
+        return [cost(record) for record in records]
+    if cost == 'size':
+        return [_size_in_bytes(record["size"]) for record in records]
+    if cost == 'cloudcover':
+        return [100 + float(record.get("cloudcoverpercentage", 0)) for record in records]
+    if cost == 'date':
+        begins = [datetime.strptime(record["beginposition"][:19], '%Y-%m-%dT%H:%M:%S') for record in records]
+        newest = max(begins) if begins else None
+        return [1 + (newest - begin).total_seconds() / (30 * 86400) for begin in begins]
+    raise ValueError("Unknown cost %r, must be 'size', 'cloudcover', 'date' or a function." % (cost,))
+
+
+def _unique_products(products):
+    """Return the product entries in order, dropping repeated entries with the same id.
+
+    Result pages may overlap if products are added to the DataHub while the pages are loaded.
+    """
+    seen = set()
+    unique = []
+    for product in products:
+        if product['id'] not in seen:
+            seen.add(product['id'])
+            unique.append(product)
+    return unique
+
+
+def _footprint_properties(record):
+    """Properties of the GeoJSON Feature of a ProductRecord in get_footprints()."""
+    # parse the following properties:
+    # platformname, identifier, product_id, date, polarisation,
+    # sensor operation mode, orbit direction, product type, download link
+    props = {
+        "product_id": record.id,
+        "date_beginposition": record["beginposition"],
+        "download_link": record.download_link
+    }
+    for str_prop in ["platformname", "identifier", "sensoroperationalmode", "orbitdirection",
+                     "producttype"]:
+        props[str_prop] = record[str_prop]
+    # Sentinel-2 has no "polarisationmode" property
+    if "polarisationmode" in record:
+        props["polarisationmode"] = record["polarisationmode"]
+    return props
+
+
+_ATTRIBUTE_CONVERTERS = {'int': int, 'double': float}
+
+
+class ProductRecord(object):
+    """Product entry of the OpenSearch results with its attributes indexed by name.
+
+    The 'str', 'date', 'int', 'double' and 'bool' attribute lists of the entry are
+    indexed once, so that an attribute's content can be looked up with record[name].
+    The content of 'int' and 'double' attributes is converted to numbers, the others are kept as strings.
+    """
+    __slots__ = ('id', 'title', 'download_link', 'attributes')
+
+    def __init__(self, entry):
+        self.id = entry['id']
+        self.title = entry.get('title')
+        # the download link is the only link without a 'rel' key
+        self.download_link = next((link['href'] for link in entry.get('link', []) if len(link) == 1), None)
+        self.attributes = {}
+        for attribute_type in ('str', 'date', 'int', 'double', 'bool'):
+            convert = _ATTRIBUTE_CONVERTERS.get(attribute_type)
+            for attribute in entry.get(attribute_type, []):
+                content = attribute['content']
+                if convert is not None:
+                    try:
+                        content = convert(content)
+                    except (TypeError, ValueError):
+                        pass
+                self.attributes[attribute['name']] = content
+
+    def __getitem__(self, name):
+        return self.attributes[name]
+
+    def __contains__(self, name):
+        return name in self.attributes
+
+    def get(self, name, default=None):
+        return self.attributes.get(name, default)
+
+
 class SentinelAPI(object):
     """Class to connect to Sentinel Data Hub, search and download imagery.
 
@@ -116,6 +324,39 @@ class SentinelAPI(object):
     api_url : string, optional
         URL of the DataHub
         defaults to 'https://scihub.copernicus.eu/apihub'
+    page_size : int, optional
+        Number of results requested per OpenSearch page, defaults to 100
+        (the maximum accepted by the DataHub)
+    max_concurrent_downloads : int or None, optional
+        Maximum number of connections downloading products at the same time, defaults to 2
+        (the per-account limit of the DataHub). A segmented download uses one connection per
+        segment. None disables the limit. Ignored if a rate_limiter is given, the limit of the
+        rate limiter then applies to all SentinelAPI objects sharing it.
+    cache : ProductInfoCache, optional
+        Cache for the product info used by download() and download_all(),
+        see sentinelsat.cache.ProductInfoCache
+    inventory : DownloadInventory, optional
+        Index of the downloaded products. download() records completed downloads in it
+        and download_all() skips the products found in it, in any directory.
+        See sentinelsat.inventory.DownloadInventory
+    pool_size : int, optional
+        Maximum number of connections kept open to the DataHub, defaults to 10.
+        Should be at least the number of parallel queries or downloads.
+    timeout : float or tuple, optional
+        Connect and read timeout in seconds for the requests to the DataHub, either
+        as a single value or as a (connect, read) tuple. Downloads with homura abort
+        the transfer if no data is received for the read timeout instead. No timeout by default.
+    keep_alive : bool, optional
+        Whether connections are kept open between requests, defaults to True
+    compression : bool, optional
+        Whether gzip compressed responses are accepted, defaults to True
+    retry_policy : RetryPolicy, optional
+        How queries, product info requests and downloads are retried after transient errors
+        like HTTP 429 and 503. Defaults to RetryPolicy(), see sentinelsat.retry.RetryPolicy
+    rate_limiter : RateLimiter, optional
+        Limits the rate of searches and product info requests and the number of download connections.
+        By default only the download connections of this object are limited by max_concurrent_downloads,
+        see sentinelsat.ratelimit.RateLimiter
 
     Attributes
     ----------
@@ -123,34 +364,361 @@ class SentinelAPI(object):
         Session to connect to DataHub
     api_url : str
         URL to the DataHub
+    page_size : int
+        Number of results requested per OpenSearch page
+    max_concurrent_downloads : int or None
+        Maximum number of connections downloading products at the same time, a setting of the rate limiter
+    cache : ProductInfoCache or None
+        Cache for the product info
+    inventory : DownloadInventory or None
+        Index of the downloaded products
+    timeout : float or tuple or None
+        Timeout of the requests to the DataHub
+    retry_policy : RetryPolicy
+        Retry policy of the requests to the DataHub
+    rate_limiter : RateLimiter
+        Rate limits of the requests to the DataHub
+    failed_downloads : dict
+        Error of the last attempt for each file path download_all() failed to download
     """
 
-    def __init__(self, user, password, api_url='https://scihub.copernicus.eu/apihub/'):
+    def __init__(self, user, password, api_url='https://scihub.copernicus.eu/apihub/', page_size=100,
+                 max_concurrent_downloads=2, cache=None, inventory=None, pool_size=10, timeout=None,
+                 keep_alive=True, compression=True, retry_policy=None, rate_limiter=None):
         self.session = requests.Session()
         self.session.auth = (user, password)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+        self.session.headers['Accept-Encoding'] = 'gzip, deflate' if compression else 'identity'
+        self.timeout = timeout
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        if rate_limiter is None:
+            rate_limiter = RateLimiter(max_concurrent_downloads=max_concurrent_downloads)
+        self.rate_limiter = rate_limiter
         self.api_url = self._url_trail_slash(api_url)
+        self.page_size = page_size
+        self.cache = cache
+        self.inventory = inventory
         self.last_query = None
         self.content = None
         self.products = None
+        self._records = None
+        self._incremental_state = None
+        self.failed_downloads = {}
+
+    @property
+    def max_concurrent_downloads(self):
+        return self.rate_limiter.max_concurrent_downloads
+
+    @max_concurrent_downloads.setter
+    def max_concurrent_downloads(self, max_concurrent_downloads):
+        self.rate_limiter.max_concurrent_downloads = max_concurrent_downloads
 
     @property
     def url(self):
-        return urljoin(self.api_url, 'search?format=json&rows=100')
+        return urljoin(self.api_url, 'search?format=json&rows=%d' % self.page_size)
 
-    def query(self, area=None, point=None, initial_date=None, end_date=datetime.now(), **keywords):
+    def _format_url(self, start=0):
+        """URL of the OpenSearch results page beginning at offset ``start``."""
+        return '%s&start=%d' % (self.url, start)
+
+    def query(self, area=None, point=None, initial_date=None, end_date=datetime.now(), max_workers=1, **keywords):
         """Query the SciHub API with the coordinates of an area, a date interval
         and any other search keywords accepted by the SciHub API.
+
+        See query_raw() for the max_workers parameter.
         """
         query = self.format_query(area, point, initial_date, end_date, **keywords)
-        self.query_raw(query)
+        self.query_raw(query, max_workers)
 
-    def query_raw(self, query):
+    def query_raw(self, query, max_workers=1):
         """Do a full-text query on the SciHub API using the format specified in
         https://scihub.copernicus.eu/twiki/do/view/SciHubUserGuide/3FullTextSearch
+
+        All result pages are fetched, see iter_products() for a lazy alternative.
+
+        Parameters
+        ----------
+        query : string
+            Full-text query
+        max_workers : int, optional
+            Number of result pages requested concurrently. Once the first page has been
+            loaded, the remaining pages are fetched in parallel if this is larger than 1.
+            Defaults to 1.
         """
         self.last_query = query
-        self.content = requests.post(self.url, dict(q=query), auth=self.session.auth)
-        _check_scihub_response(self.content)
+        self.products = None
+        self._records = None
+        if max_workers > 1:
+            products = self._query_pages_parallel(query, max_workers)
+        else:
+            products = self.iter_products(query)
+        self.products = _unique_products(products)
+
+    def iter_products(self, query=None, stream=False):
+        """Iterate over the results of a full-text query page by page.
+
+        The OpenSearch result pages are requested lazily, so the first products
+        can be processed while the following pages have not been fetched yet.
+
+        Parameters
+        ----------
+        query : string, optional
+            Full-text query, defaults to the last query made with query() or query_raw().
+        stream : bool, optional
+            If True, each page is parsed incrementally while it is received and its entries are
+            yielded one at a time, so that neither the response nor the decoded page are held
+            in memory at once. Useful with a large page_size. Requires ijson. Defaults to False.
+
+        Yields
+        ------
+        dict
+            A product entry of the OpenSearch response, as returned by get_products().
+        """
+        if query is None:
+            query = self.last_query
+        assert not stream or _import_optional('ijson') is not None, "ijson must be installed to stream the results."
+        start = 0
+        while True:
+            if stream:
+                feed = {}
+                entries = self._stream_page(query, start, feed)
+            else:
+                entries, total_results = self._query_page(query, start)
+            count = 0
+            for entry in entries:
+                count += 1
+                yield entry
+            if stream:
+                total_results = int(feed.get('opensearch:totalResults', 0))
+            start += count
+            if count == 0 or start >= total_results:
+                break
+
+    def query_incremental(self, state_file, area=None, point=None, initial_date='NOW-1DAY', end_date='NOW',
+                          commit=True, **keywords):
+        """Query the SciHub API like query(), but only return products not seen in previous runs.
+
+        The latest ingestion date of the products found and the ids of the products ingested
+        at that time are persisted in a JSON file, separately for each query. The next run only
+        asks the DataHub for products ingested since then, so get_products(), get_footprints()
+        and download_all() only cover the new products.
+
+        By default the state is updated as soon as the query succeeds, so products which then fail
+        to download are not returned again. Pass commit=False and call commit_incremental() once the
+        products have been processed to avoid this.
+
+        Parameters
+        ----------
+        state_file : string
+            Path of the JSON file the state is kept in. It can be shared by several queries.
+        initial_date, end_date : optional
+            Date range of the query, see query(). Defaults to the last 24 hours ('NOW-1DAY' to 'NOW').
+        commit : bool, optional
+            Whether the state is saved right away, defaults to True
+
+        Other Parameters
+        ----------------
+        See query(). The area, point and keywords identify the query in the state file,
+        the date range does not.
+        """
+        query = self.format_query(area, point, initial_date, end_date, **keywords)
+        key = self._format_query_filters(area, point, **keywords)
+        query_state = self._load_incremental_state(state_file).get(key)
+
+        if query_state is None:
+            self.query_raw(query)
+        else:
+            self.query_raw('%s AND (ingestiondate:[%s TO NOW])' % (query, query_state['ingestiondate']))
+            seen = set(query_state['seen'])
+            self.products = [product for product in self.products if product['id'] not in seen]
+            self._records = None
+
+        ingestion_dates = dict((record.id, record['ingestiondate']) for record in self._get_records()
+                               if 'ingestiondate' in record)
+        self._incremental_state = None
+        if ingestion_dates:
+            watermark = max(ingestion_dates.values())
+            seen = [id for id, ingestion_date in ingestion_dates.items() if ingestion_date == watermark]
+            if query_state is not None and watermark == query_state['ingestiondate']:
+                seen += query_state['seen']
+            self._incremental_state = (state_file, key, {'ingestiondate': watermark, 'seen': sorted(set(seen))})
+        if commit:
+            self.commit_incremental()
+
+    def commit_incremental(self):
+        """Save the state of the last query_incremental() made with commit=False, e.g. after download_all()."""
+        if self._incremental_state is None:
+            return
+        state_file, key, query_state = self._incremental_state
+        # re-read the file, other queries may have updated it in the meantime
+        state = self._load_incremental_state(state_file)
+        state[key] = query_state
+        with open(state_file, 'w') as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        self._incremental_state = None
+
+    @staticmethod
+    def _load_incremental_state(state_file):
+        if not exists(state_file):
+            return {}
+        with open(state_file) as f:
+            return json.load(f)
+
+    def query_split(self, area=None, point=None, initial_date=None, end_date=None,
+                    window=timedelta(days=30), max_results=1000, max_workers=4, **keywords):
+        """Query the SciHub API like query(), split into sub-queries over shorter time windows.
+
+        Long date ranges are cut into windows which are queried concurrently. A window
+        with more than max_results products is split in half again until it is small enough,
+        so that no sub-query times out or runs into the result limits of the DataHub.
+        The results are merged in order of the windows, duplicates are removed.
+
+        Parameters
+        ----------
+        initial_date, end_date : datetime, date or YYYYMMDD string
+            Date range of the query. Unlike in query(), relative dates like 'NOW-1DAY'
+            are not supported since they can not be split. The end date defaults to the time
+            of the call and the initial date to 24 hours before the end date.
+        window : timedelta, optional
+            Initial length of the time windows, defaults to 30 days
+        max_results : int, optional
+            Number of results of a window above which it is split in half, defaults to 1000
+        max_workers : int, optional
+            Number of windows queried in parallel, defaults to 4
+
+        Other Parameters
+        ----------------
+        See query().
+        """
+        if end_date is None:
+            end_date = datetime.now()
+        end_date = _parse_date(end_date)
+        if initial_date is None:
+            initial_date = end_date - timedelta(hours=24)
+        initial_date = _parse_date(initial_date)
+
+        windows = []
+        window_start = initial_date
+        while window_start < end_date:
+            windows.append((window_start, min(window_start + window, end_date)))
+            window_start += window
+
+        def query_window(window):
+            return self._query_window(area, point, window[0], window[1], max_results, keywords)
+
+        self.last_query = self.format_query(area, point, initial_date, end_date, **keywords)
+        self.products = None
+        self._records = None
+        pool = ThreadPool(max(min(max_workers, len(windows)), 1))
+        try:
+            results = pool.map(query_window, windows)
+        finally:
+            pool.terminate()
+        self.products = _unique_products(product for products in results for product in products)
+
+    def _query_window(self, area, point, start, end, max_results, keywords):
+        """Load all results of a time window, splitting it in half while it has more than max_results."""
+        query = self.format_query(area, point, start, end, **keywords)
+        products, total_results = self._query_page(query)
+        if total_results > max_results and end - start > timedelta(seconds=2):
+            middle = start + (end - start) // 2
+            return (self._query_window(area, point, start, middle, max_results, keywords) +
+                    self._query_window(area, point, middle, end, max_results, keywords))
+        while products and len(products) < total_results:
+            entries, total_results = self._query_page(query, len(products))
+            if not entries:
+                break
+            products.extend(entries)
+        return products
+
+    def _query_pages_parallel(self, query, max_workers):
+        """Load the first page of results, then all remaining pages with a pool of threads.
+
+        Returns the product entries of all pages in order.
+        """
+        products, total_results = self._query_page(query)
+        # the DataHub may return fewer rows than requested, step by the size of the first page
+        page_rows = len(products)
+        offsets = list(range(page_rows, total_results, page_rows)) if products else []
+        if not offsets:
+            return products
+
+        pool = ThreadPool(min(max_workers, len(offsets)))
+        try:
+            pages = pool.map(lambda start: self._query_page(query, start)[0], offsets)
+        finally:
+            pool.terminate()
+        for start, entries in zip(offsets, pages):
+            products.extend(entries)
+            # load the rest of a page which came back shorter, so that no results are skipped
+            end = min(start + page_rows, total_results)
+            start += len(entries)
+            while entries and start < end:
+                entries = self._query_page(query, start)[0]
+                products.extend(entries)
+                start += len(entries)
+        return products
+
+    def _query_page(self, query, start=0):
+        """Request a single page of OpenSearch results.
+
+        The response is kept in self.content, also if it is not valid.
+        Transient errors are retried according to the retry policy.
+
+        Returns
+        -------
+        list of dict
+            The product entries of the page
+        int
+            The total number of results of the query
+        """
+        def request_page():
+            self._throttle()
+            response = self.session.post(self._format_url(start), dict(q=query), timeout=self.timeout)
+            # decode the local response, parallel workers replace self.content at any time
+            self.content = response
+            return _check_scihub_response(response)
+
+        feed = self.retry_policy.call(request_page).get('feed', {})
+        return [_normalize_entry(entry) for entry in _get_entries(feed)], int(feed.get('opensearch:totalResults', 0))
+
+    def _stream_page(self, query, start, feed):
+        """Request a single page of OpenSearch results and parse it while it is received.
+
+        Yields the product entries of the page. The other values of the feed, like
+        opensearch:totalResults, are stored in the feed dict once the page has been read.
+        """
+        def request_page():
+            self._throttle()
+            response = self.session.post(self._format_url(start), dict(q=query), timeout=self.timeout,
+                                         stream=True)
+            if response.status_code >= 400:
+                self.content = response
+                _check_scihub_response(response)
+            return response
+
+        import ijson
+        response = self.retry_policy.call(request_page)
+        try:
+            response.raw.decode_content = True
+            for entry in _iter_feed_entries(response.raw, feed):
+                yield entry
+        except ijson.JSONError:
+            raise SentinelAPIError(response.status_code, msg="API response not valid. JSON decoding failed.")
+        finally:
+            response.close()
+
+    def _throttle(self):
+        """Wait until the rate limiter allows the next request to the DataHub."""
+        self.rate_limiter.acquire()
+
+    def _download_slot(self, connections=1):
+        """Hold download connections of the rate limiter, shared with the other objects using it."""
+        return self.rate_limiter.download_slot(connections)
 
     @staticmethod
     def _url_trail_slash(api_url):
@@ -173,7 +741,11 @@ class SentinelAPI(object):
             format_date(initial_date),
             format_date(end_date)
         )
-        
+        return acquisition_date + SentinelAPI._format_query_filters(area, point, **keywords)
+
+    @staticmethod
+    def _format_query_filters(area=None, point=None, **keywords):
+        """Format the spatial and keyword filters of format_query(), without the date range."""
         if area is not None:
             query_area = ' AND (footprint:"Intersects(POLYGON((%s)))")' % area
         else:
@@ -188,32 +760,33 @@ class SentinelAPI(object):
         for kw in sorted(keywords.keys()):
             filters += ' AND (%s:%s)' % (kw, keywords[kw])
 
-        query = ''.join([acquisition_date, query_area, query_point, filters])
-        return query
+        return ''.join([query_area, query_point, filters])
 
     def get_products(self):
-        """Return the result of the Query in json format."""
-        try:
-            self.products = self.content.json()['feed']['entry']
-            # this verification is necessary because if the query returns only
-            # one product, self.products will be a dict not a list
-            if type(self.products) == dict:
-                return [self.products]
-            else:
-                return self.products
-        except KeyError:
-            print('No products found in this query.')
+        """Return the products found by the last query in json format.
+
+        The response is decoded only once per query, the same list is returned on every call.
+        """
+        if self.products is None:
+            # raise the error of a failed query, if there was one
+            if self.content is not None:
+                _check_scihub_response(self.content)
             return []
-        except ValueError:
-            raise SentinelAPIError(http_status=self.content.status_code,
-                                   msg='API response not valid. JSON decoding failed.',
-                                   response_body=self.content.content)
+        if not self.products:
+            print('No products found in this query.')
+        return self.products
+
+    def _get_records(self):
+        """Return a ProductRecord for each product of the last query, built once per query."""
+        if self._records is None:
+            self._records = [ProductRecord(product) for product in self.get_products()]
+        return self._records
 
     def get_products_size(self):
         """Return the total filesize in GB of all products in the query"""
         size_total = 0
-        for product in self.get_products():
-            size_product = next(x for x in product["str"] if x["name"] == "size")["content"]
+        for record in self._get_records():
+            size_product = record["size"]
             size_value = float(size_product.split(" ")[0])
             size_unit = str(size_product.split(" ")[1])
             if size_unit == "MB":
@@ -223,99 +796,293 @@ class SentinelAPI(object):
             size_total += size_value
         return round(size_total, 2)
 
+    def to_dataframe(self):
+        """Return the products of the last query as a pandas DataFrame, indexed by product id.
+
+        There is a column for the title and each attribute of the products. Date attributes are
+        converted to datetimes, int and double attributes to numbers, the size to a number of
+        bytes. The footprint is kept as a WKT string.
+
+        Requires pandas. Use the to_parquet() method of the DataFrame for a columnar export.
+        """
+        pd = _import_optional('pandas')
+        assert pd is not None, "pandas must be installed to use to_dataframe()."
+        records = self._get_records()
+        attribute_types = {}
+        for product in self.get_products():
+            for attribute_type in ('str', 'date', 'int', 'double', 'bool'):
+                for attribute in product.get(attribute_type, []):
+                    attribute_types[attribute['name']] = attribute_type
+
+        columns = {'title': [record.title for record in records]}
+        for name in attribute_types:
+            columns[name] = [record.get(name) for record in records]
+        df = pd.DataFrame(columns, index=pd.Index([record.id for record in records], name='id'),
+                          columns=['title'] + sorted(attribute_types))
+        for name, attribute_type in attribute_types.items():
+            if attribute_type == 'date':
+                df[name] = pd.to_datetime(df[name], utc=True)
+            elif attribute_type in ('int', 'double'):
+                df[name] = pd.to_numeric(df[name])
+            elif attribute_type == 'bool':
+                df[name] = df[name] == 'true'
+        if 'size' in df:
+            df['size'] = df['size'].map(_size_in_bytes, na_action='ignore')
+        return df
+
     def get_footprints(self):
         """Return the footprints of the resulting scenes in GeoJSON format"""
-        id = 0
-        feature_list = []
-
-        for scene in self.get_products():
-            id += 1
-            # parse the polygon
-            coord_list = next(
-                x
-                for x in scene["str"]
-                if x["name"] == "footprint"
-            )["content"][10:-2].split(",")
-            coord_list_split = (coord.split(" ") for coord in coord_list)
-            poly = geojson.Polygon([[
-                tuple((float(coord[0]), float(coord[1])))
-                for coord in coord_list_split
-                ]])
-
-            # parse the following properties:
-            # platformname, identifier, product_id, date, polarisation,
-            # sensor operation mode, orbit direction, product type, download link
-            props = {
-                "product_id": scene["id"],
-                "date_beginposition": next(
-                    x
-                    for x in scene["date"]
-                    if x["name"] == "beginposition"
-                )["content"],
-                "download_link": next(
-                    x
-                    for x in scene["link"]
-                    if len(x.keys()) == 1
-                )["href"]
-            }
-            # Sentinel-2 has no "polarisationmode" property
-            try:
-                str_properties = ["platformname", "identifier", "polarisationmode",
-                                  "sensoroperationalmode", "orbitdirection", "producttype"]
-                for str_prop in str_properties:
-                    props.update(
-                        {str_prop: next(x for x in scene["str"] if x["name"] == str_prop)["content"]}
-                    )
-            except:
-                str_properties = ["platformname", "identifier",
-                                  "sensoroperationalmode", "orbitdirection", "producttype"]
-                for str_prop in str_properties:
-                    props.update(
-                        {str_prop: next(x for x in scene["str"] if x["name"] == str_prop)["content"]}
-                    )
-
-            feature_list.append(
-                geojson.Feature(geometry=poly, id=id, properties=props)
-            )
-        return geojson.FeatureCollection(feature_list)
+        import geojson
+        return geojson.FeatureCollection([
+            geojson.Feature(geometry=feature['geometry'], id=feature['id'], properties=feature['properties'])
+            for feature in self._iter_footprint_features()
+        ])
+
+    def write_footprints(self, path, batch_size=1000):
+        """Write the footprints of the resulting scenes to a GeoJSON file.
+
+        The footprints are parsed in batches and the features are written one by one, without building
+        the whole FeatureCollection in memory. The file has the same content as get_footprints().
+
+        Parameters
+        ----------
+        path : string
+            Path of the GeoJSON file
+        batch_size : int, optional
+            Number of footprints parsed at once, defaults to 1000
+        """
+        with open(path, 'w') as f:
+            write_feature_collection(self._iter_footprint_features(batch_size), f)
+
+    def get_coverage(self, area, resolution=100):
+        """Compute which fraction of an area the footprint of each resulting scene covers.
+
+        See sentinelsat.footprints.coverage_fractions() for the parameters. Requires NumPy.
+
+        Returns
+        -------
+        dict[string, float]
+            Maps the id of each product to the covered fraction of the area, between 0 and 1
+        """
+        records = self._get_records()
+        fractions = coverage_fractions(parse_footprints([record["footprint"] for record in records]),
+                                       area, resolution)
+        return dict((record.id, float(fraction)) for record, fraction in zip(records, fractions))
+
+    def filter_products(self, area=None, min_coverage=0., max_cloudcover=None, resolution=100, **attributes):
+        """Filter the products of the last query locally, e.g. before download_all().
+
+        The DataHub returns all scenes intersecting the search area, also those covering only a sliver
+        of it. This removes the products covering less than min_coverage of the area, computed from
+        their footprints with get_coverage(), and the products not matching the other criteria.
+
+        Parameters
+        ----------
+        area : string or tuple or dict, optional
+            Area of interest, see sentinelsat.footprints.coverage_fractions()
+        min_coverage : float, optional
+            Minimum fraction of the area covered by a product, between 0 and 1. Defaults to 0.
+        max_cloudcover : float, optional
+            Maximum cloud cover percentage of Sentinel-2 products
+        resolution : int, optional
+            Number of sample points along the longer side of the bounding box of the area, defaults to 100
+        **attributes
+            Required values of product attributes, e.g. orbitdirection='ASCENDING' or relativeorbitnumber=66
+
+        Returns
+        -------
+        list of dict
+            The remaining products, as returned by get_products() from now on
+        """
+        records = self._get_records()
+        keep = [True] * len(records)
+        if area is not None and min_coverage > 0:
+            coverage = self.get_coverage(area, resolution)
+            keep = [coverage[record.id] >= min_coverage for record in records]
+        for i, record in enumerate(records):
+            if not keep[i]:
+                continue
+            if max_cloudcover is not None and record.get("cloudcoverpercentage", 0) > max_cloudcover:
+                keep[i] = False
+            elif any(record.get(name) != value for name, value in attributes.items()):
+                keep[i] = False
+        self.products = [product for product, kept in zip(self.get_products(), keep) if kept]
+        self._records = [record for record, kept in zip(records, keep) if kept]
+        print("%d of %d products remain after filtering" % (len(self.products), len(keep)))
+        return self.products
+
+    def select_covering_products(self, area, cost=None, tolerance=0.01, resolution=100):
+        """Keep only a small set of the products of the last query which together cover an area.
+
+        Query results often cover the area several times over. For a mosaic, the products are
+        selected with a greedy set cover over their footprints, see sentinelsat.footprints.greedy_cover().
+        Requires NumPy.
+
+        Parameters
+        ----------
+        area : string or tuple or dict
+            Area to cover, see sentinelsat.footprints.coverage_fractions()
+        cost : string or callable, optional
+            What to minimize besides the number of products:
+
+            * 'size': the total size of the products
+            * 'cloudcover': the cloud cover, a fully clouded product costs twice as much as a clear one
+            * 'date': the age, a product one month older than the newest one costs twice as much
+            * a function returning the positive cost of a ProductRecord
+
+            All products cost the same by default.
+        tolerance : float, optional
+            Fraction of the area which may be left uncovered, defaults to 0.01
+        resolution : int, optional
+            Number of sample points along the longer side of the bounding box of the area, defaults to 100
+
+        Returns
+        -------
+        list of dict
+            The selected products in the order of the query results, as returned by get_products() from now on
+        """
+        records = self._get_records()
+        footprints = parse_footprints([record["footprint"] for record in records])
+        selected = set(greedy_cover(footprints, area, _product_costs(records, cost), tolerance, resolution))
+        keep = [i in selected for i in range(len(records))]
+        self.products = [product for product, kept in zip(self.get_products(), keep) if kept]
+        self._records = [record for record, kept in zip(records, keep) if kept]
+        print("Selected %d of %d products covering the area" % (len(self.products), len(keep)))
+        return self.products
+
+    def _iter_footprint_features(self, batch_size=1000):
+        """Generate the GeoJSON Feature of each resulting scene, parsing the footprints in batches."""
+        records = self._get_records()
+        for i in range(0, len(records), batch_size):
+            batch = records[i:i + batch_size]
+            footprints = parse_footprints([record["footprint"] for record in batch])
+            for j, (record, polygons) in enumerate(zip(batch, footprints)):
+                yield {
+                    "type": "Feature",
+                    "id": i + j + 1,
+                    "geometry": footprint_geometry(polygons),
+                    "properties": _footprint_properties(record)
+                }
 
     def get_product_info(self, id):
         """Access SciHub API to get info about a Product. Returns a dict
         containing the id, title, size, md5sum, date, footprint and download url
         of the Product. The date field receives the Start ContentDate of the API.
         """
-
+        self._throttle()
         response = self.session.get(
-            urljoin(self.api_url, "odata/v1/Products('%s')/?$format=json" % id)
+            urljoin(self.api_url, "odata/v1/Products('%s')/?$format=json" % id),
+            timeout=self.timeout
         )
-        _check_scihub_response(response)
-
-        product_json = response.json()
-
-        # parse the GML footprint to same format as returned
-        # by .get_coordinates()
-        geometry_xml = ET.fromstring(product_json["d"]["ContentGeometry"])
-        poly_coords = geometry_xml \
-            .find('{http://www.opengis.net/gml}outerBoundaryIs') \
-            .find('{http://www.opengis.net/gml}LinearRing') \
-            .findtext('{http://www.opengis.net/gml}coordinates')
-        coord_string = ",".join(
-            [" ".join(double_coord[::-1]) for double_coord in [coord.split(",") for coord in poly_coords.split(" ")]]
+        return _parse_product_info(_check_scihub_response(response)['d'], self.api_url)
+
+    def get_products_info(self, ids, batch_size=50, max_workers=4):
+        """Get the info of many products at once, see get_product_info().
+
+        The products are requested in batches with an OData $filter on their ids, which are sent
+        in parallel. Batches the DataHub can not answer and products missing from the answer of
+        a batch are requested one by one instead. Products in the cache are not requested.
+        Transient errors are retried according to the retry policy.
+
+        Parameters
+        ----------
+        ids : list of string
+            UUIDs of the products
+        batch_size : int, optional
+            Number of products requested at once, defaults to 50
+        max_workers : int, optional
+            Number of requests sent in parallel, defaults to 4
+
+        Returns
+        -------
+        dict[string, dict]
+            Maps the id of each product to its product info as returned by get_product_info()
+        """
+        result = {}
+        if self.cache is not None:
+            for id in ids:
+                product_info = self.cache.get(id)
+                if product_info is not None:
+                    result[id] = product_info
+        missing = [id for id in ids if id not in result]
+        batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+
+        def get_batch(batch):
+            try:
+                batch_result = self.retry_policy.call(self._get_products_info_batch, batch)
+            except SentinelAPIError:
+                batch_result = {}
+            for id in batch:
+                if id not in batch_result:
+                    batch_result[id] = self.retry_policy.call(self.get_product_info, id)
+            return batch_result
+
+        pool = ThreadPool(max(min(max_workers, len(batches)), 1))
+        try:
+            for batch_result in pool.map(get_batch, batches):
+                result.update(batch_result)
+        finally:
+            pool.terminate()
+        if self.cache is not None:
+            for id in missing:
+                self.cache.set(result[id])
+        return result
+
+    def _get_products_info_batch(self, ids):
+        """Request the info of several products with a single OData query."""
+        id_filter = ' or '.join("Id eq '%s'" % id for id in ids)
+        self._throttle()
+        response = self.session.get(
+            urljoin(self.api_url, "odata/v1/Products"),
+            params={'$format': 'json', '$filter': id_filter, '$top': len(ids)},
+            timeout=self.timeout
         )
+        products = _check_scihub_response(response)['d']['results']
+        return dict((product['Id'], _parse_product_info(product, self.api_url)) for product in products)
+
+    def _get_product_info_cached(self, id):
+        """Return the product info from the cache if possible, otherwise from get_product_info()."""
+        if self.cache is not None:
+            product_info = self.cache.get(id)
+            if product_info is not None:
+                return product_info
+        product_info = self.get_product_info(id)
+        if self.cache is not None:
+            self.cache.set(product_info)
+        return product_info
+
+    def get_checksums(self, paths, chunk_size=50):
+        """Look up the MD5 checksums of product files on disk on the server.
 
-        keys = ['id', 'title', 'size', 'md5', 'date', 'footprint', 'url']
-        values = [
-            product_json['d']['Id'],
-            product_json['d']['Name'],
-            int(product_json['d']['ContentLength']),
-            product_json['d']['Checksum']['Value'],
-            convert_timestamp(product_json['d']['ContentDate']['Start']),
-            coord_string,
-            urljoin(self.api_url, "odata/v1/Products('%s')/$value" % id)
-        ]
-        return dict(zip(keys, values))
-
-    def download(self, id, directory_path='.', checksum=False, check_existing=False, **kwargs):
+        The files are matched to products by their file name, i.e. the product title.
+
+        Parameters
+        ----------
+        paths : list of string
+            Paths of the product files, e.g.
+            "S1A_EW_GRDH_1SDH_20141003T003840_20141003T003920_002658_002F54_4DD1.zip"
+        chunk_size : int, optional
+            Number of product titles searched for with one query, defaults to 50
+
+        Returns
+        -------
+        dict[string, string]
+            Maps each path to the checksum of its product. Paths which do not match
+            any product on the server are left out.
+        """
+        titles = dict((splitext(basename(path))[0], path) for path in paths)
+        sorted_titles = sorted(titles)
+        checksums = {}
+        for i in range(0, len(sorted_titles), chunk_size):
+            products = [product for product in self.iter_products(' OR '.join(sorted_titles[i:i + chunk_size]))
+                        if product['title'] in titles]
+            products_info = self.get_products_info([product['id'] for product in products])
+            for product in products:
+                checksums[titles[product['title']]] = products_info[product['id']]['md5']
+        return checksums
+
+    def download(self, id, directory_path='.', checksum=False, check_existing=False, segments=1, product_info=None,
+                 **kwargs):
         """Download a product using homura.
 
         Uses the filename on the server for the downloaded file, e.g.
@@ -324,6 +1091,8 @@ class SentinelAPI(object):
         Incomplete downloads are continued and complete files are skipped.
 
         Further keyword arguments are passed to the homura.download() function.
+        They are not used for segmented downloads and when checksum is True, in which case
+        the file is downloaded with the session of the API object instead.
 
         Parameters
         ----------
@@ -333,12 +1102,20 @@ class SentinelAPI(object):
             Where the file will be downloaded
         checksum : bool, optional
             If True, verify the downloaded file's integrity by checking its MD5 checksum.
+            The checksum is computed while the data is written to disk, without reading the file again.
             Throws InvalidChecksumError if the checksum does not match.
             Defaults to False.
         check_existing : bool, optional
             If True and a fully downloaded file with the same name exists on the disk,
             verify its integrity using its MD5 checksum. Re-download in case of non-matching checksums.
             Defaults to False.
+        segments : int, optional
+            If larger than 1, the file is split into this number of byte ranges which are
+            downloaded in parallel over separate connections, see _download_segmented().
+            Each connection counts against max_concurrent_downloads. An interrupted segmented
+            download is always resumed by its byte ranges, over this number of connections. Defaults to 1.
+        product_info : dict, optional
+            Info of the product as returned by get_product_info(), requested from the DataHub if not given.
 
         Returns
         -------
@@ -350,16 +1127,12 @@ class SentinelAPI(object):
         Raises
         ------
         InvalidChecksumError
-            If the MD5 checksum does not match the checksum on the server.
+            If the MD5 checksum does not match the checksum on the server. The corrupt file is removed.
+        ValueError
+            If segments exceeds max_concurrent_downloads
         """
-        # Check if API is reachable.
-        product_info = None
-        while product_info is None:
-            try:
-                product_info = self.get_product_info(id)
-            except SentinelAPIError as e:
-                print("Invalid API response:\n{}\nTrying again in 1 minute.".format(str(e)))
-                sleep(60)
+        if product_info is None:
+            product_info = self.retry_policy.call(self._get_product_info_cached, id)
 
         path = join(directory_path, product_info['title'] + '.zip')
         kwargs = self._fillin_cainfo(kwargs)
@@ -368,29 +1141,153 @@ class SentinelAPI(object):
 
         # Check if the file exists and passes md5 test
         # Homura will by default continue the download if the file exists but is incomplete
-        if exists(path) and getsize(path) == product_info['size']:
+        # An unfinished segmented download has the full size already, but still has its segments file
+        if (exists(path) and getsize(path) == product_info['size'] and
+                not exists(path + SEGMENTS_SUFFIX)):
             if not check_existing or md5_compare(path, product_info['md5']):
                 print('%s was already downloaded.' % path)
+                if self.inventory is not None:
+                    self.inventory.add(path, product_info, verified=check_existing)
                 return path, product_info
             else:
                 print('%s was already downloaded but is corrupt: checksums do not match. Re-downloading.' % path)
                 remove(path)
 
-        if (exists(path) and getsize(path) >= 2 ** 31 and
-            pycurl.version.split()[0].lower() <= 'pycurl/7.43.0'):
-            # Workaround for PycURL's bug when continuing > 2 GB files
-            # https://github.com/pycurl/pycurl/issues/405
-            remove(path)
+        with self._download_slot(segments):
+            md5_digest = None
+            if segments > 1 or exists(path + SEGMENTS_SUFFIX):
+                self._download_segmented(product_info['url'], path, product_info['size'], segments)
+            elif checksum is True:
+                md5_digest = self._download_with_md5(product_info['url'], path, product_info['size'])
+            else:
+                import homura
+                import pycurl
+                if (exists(path) and getsize(path) >= 2 ** 31 and
+                    pycurl.version.split()[0].lower() <= 'pycurl/7.43.0'):
+                    # Workaround for PycURL's bug when continuing > 2 GB files
+                    # https://github.com/pycurl/pycurl/issues/405
+                    remove(path)
 
-        homura.download(product_info['url'], path=path, session=self.session, **kwargs)
+                homura.download(product_info['url'], path=path, session=self.session,
+                                **self._fillin_timeout(kwargs))
 
         # Check integrity with MD5 checksum
         if checksum is True:
-            if not md5_compare(path, product_info['md5']):
+            if md5_digest is None:
+                checksum_matches = md5_compare(path, product_info['md5'])
+            else:
+                checksum_matches = md5_digest.lower() == product_info['md5'].lower()
+            if not checksum_matches:
+                # remove the corrupt file, a full-size file would be taken as complete by the next attempt
+                remove(path)
                 raise InvalidChecksumError('File corrupt: checksums do not match')
+        if self.inventory is not None:
+            self.inventory.add(path, product_info, verified=checksum)
         return path, product_info
 
-    def download_all(self, directory_path='.', max_attempts=10, checksum=False, check_existing=False, **kwargs):
+    def _download_with_md5(self, url, path, size):
+        """Download a file while computing its MD5 checksum from the received data.
+
+        An incomplete file is continued with a Range request, only its existing part
+        is read from disk again to initialize the checksum.
+
+        Returns
+        -------
+        string
+            Hex digest of the MD5 checksum of the complete file
+        """
+        md5 = hashlib.md5()
+        offset = 0
+        if exists(path) and getsize(path) < size:
+            offset = getsize(path)
+            with open(path, 'rb') as f:
+                for block_data in iter(lambda: f.read(2 ** 20), b''):
+                    md5.update(block_data)
+
+        headers = {'Range': 'bytes=%d-' % offset} if offset > 0 else {}
+        response = self.session.get(url, headers=headers, stream=True, timeout=self.timeout)
+        response.raise_for_status()
+        if offset > 0 and response.status_code != 206:
+            # The server sends the whole file, start over
+            md5 = hashlib.md5()
+            offset = 0
+
+        from tqdm import tqdm
+        progress = tqdm(desc="Downloading", total=size, initial=offset, unit="B", unit_scale=True)
+        with open(path, 'ab' if offset > 0 else 'wb') as f:
+            for chunk in response.iter_content(chunk_size=2 ** 16):
+                f.write(chunk)
+                md5.update(chunk)
+                progress.update(len(chunk))
+        progress.close()
+        return md5.hexdigest()
+
+    def _download_segmented(self, url, path, size, segments):
+        """Download a file by fetching byte ranges over several connections in parallel.
+
+        The ranges are written into a file preallocated to its full size. The indices of the
+        completed ranges are tracked in a JSON file next to it (path + SEGMENTS_SUFFIX), so that
+        resuming an interrupted download only fetches the missing ranges, with the ranges of the
+        interrupted download and over the given number of connections. The first ranges of
+        a partial file left by a plain download are reused as well.
+        """
+        segment_size = max(-(-size // segments), 1)
+        segments_path = path + SEGMENTS_SUFFIX
+
+        completed = set()
+        if exists(segments_path) and exists(path) and getsize(path) == size:
+            with open(segments_path) as f:
+                state = json.load(f)
+            segment_size = state['segment_size']
+            completed = set(state['completed'])
+        ranges = [(start, min(start + segment_size, size) - 1) for start in range(0, size, segment_size)]
+        if exists(path) and not exists(segments_path) and getsize(path) < size:
+            # reuse what a non-segmented download has written so far
+            completed = set(i for i, (start, end) in enumerate(ranges) if end < getsize(path))
+        mode = 'r+b' if exists(path) else 'wb'
+        with open(path, mode) as f:
+            f.truncate(size)
+
+        lock = threading.Lock()
+
+        def save_state():
+            with open(segments_path, 'w') as f:
+                json.dump({'segment_size': segment_size, 'completed': sorted(completed)}, f)
+
+        save_state()
+        from tqdm import tqdm
+        progress = tqdm(desc="Downloading", total=size, unit="B", unit_scale=True,
+                        initial=sum(ranges[i][1] - ranges[i][0] + 1 for i in completed))
+
+        def download_range(i):
+            start, end = ranges[i]
+            response = self.session.get(url, headers={'Range': 'bytes=%d-%d' % (start, end)}, stream=True,
+                                        timeout=self.timeout)
+            if response.status_code != 206:
+                response.raise_for_status()
+                raise SentinelAPIError(response.status_code, msg='The server does not support range requests.')
+            with open(path, 'r+b') as f:
+                f.seek(start)
+                for chunk in response.iter_content(chunk_size=2 ** 16):
+                    f.write(chunk)
+                    progress.update(len(chunk))
+                if f.tell() != end + 1:
+                    raise SentinelAPIError(response.status_code, msg='Incomplete byte range received.')
+            with lock:
+                completed.add(i)
+                save_state()
+
+        missing = [i for i in range(len(ranges)) if i not in completed]
+        pool = ThreadPool(min(segments, len(missing) or 1))
+        try:
+            pool.map(download_range, missing)
+        finally:
+            pool.terminate()
+            progress.close()
+        remove(segments_path)
+
+    def download_all(self, directory_path='.', max_attempts=10, checksum=False, check_existing=False,
+                     max_workers=1, **kwargs):
         """Download all products returned in query() or query_raw().
 
         File names on the server are used for the downloaded files, e.g.
@@ -398,6 +1295,8 @@ class SentinelAPI(object):
 
         In case of interruptions or other exceptions, downloading will restart from where it left off.
         Downloading is attempted at most max_attempts times to avoid getting stuck with unrecoverable errors.
+        The attempts are spaced out with the backoff of the retry policy and a product is given up early
+        on permanent errors like HTTP 404 or if the total wait time of the retry policy is exceeded.
 
         Parameters
         ----------
@@ -405,6 +1304,10 @@ class SentinelAPI(object):
             Directory where the downloaded files will be downloaded
         max_attempts : int, optional
             Number of allowed retries before giving up downloading a product. Defaults to 10.
+        max_workers : int, optional
+            Number of products downloaded at the same time. Limited by the max_concurrent_downloads
+            attribute, since the DataHub rejects connections above the per-account limit. Segmented
+            downloads count with their number of segments. Defaults to 1.
 
         Other Parameters
         ----------------
@@ -414,33 +1317,121 @@ class SentinelAPI(object):
         -------
         dict[string, dict|None]
             A dictionary with an entry for each product mapping the downloaded file path to its product info
-            (returned by get_product_info()). Product info is set to None if downloading the product failed.
+            (returned by get_product_info()). Product info is set to None if downloading the product failed,
+            the error is then found in the failed_downloads attribute.
+
+        Raises
+        ------
+        ValueError
+            If the segments of a download exceed max_concurrent_downloads
         """
+        if self.max_concurrent_downloads is not None:
+            segments = kwargs.get('segments', 1)
+            if segments > self.max_concurrent_downloads:
+                raise ValueError("A download with %d segments exceeds max_concurrent_downloads=%d"
+                                 % (segments, self.max_concurrent_downloads))
+            limit = self.max_concurrent_downloads // segments
+            if max_workers > limit:
+                print("Limiting the number of parallel downloads to %d" % limit)
+                max_workers = limit
         result = {}
+        unverified = set()
+        self.failed_downloads = {}
         products = self.get_products()
+        if self.inventory is not None:
+            # skip completed products without contacting the DataHub, verified ones if checksums are requested
+            downloaded = self.inventory.get_many(product['id'] for product in products)
+            for path, product_info, verified in downloaded.values():
+                if verified or not (checksum or check_existing):
+                    result[path] = product_info
+                else:
+                    # the file on disk is checked instead of being downloaded again
+                    unverified.add(product_info['id'])
+            skipped = set(product_info['id'] for product_info in result.values())
+            if skipped:
+                print("%d products were already downloaded" % len(skipped))
+                products = [product for product in products if product['id'] not in skipped]
         print("Will download %d products" % len(products))
-        for i, product in enumerate(products):
-            path = join(directory_path, product['title'] + '.zip')
-            product_info = None
-            download_successful = False
-            remaining_attempts = max_attempts
-            while not download_successful and remaining_attempts > 0:
-                try:
-                    path, product_info = self.download(product['id'], directory_path, checksum, check_existing,
-                                                       **kwargs)
-                    download_successful = True
-                except (KeyboardInterrupt, SystemExit, SystemError, MemoryError):
-                    raise
-                except InvalidChecksumError:
-                    print("Invalid checksum. The downloaded file is corrupted.")
-                except:
-                    print("There was an error downloading %s" % product['title'], file=sys.stderr)
-                    traceback.print_exc()
-                remaining_attempts -= 1
-            result[path] = product_info
-            print("{}/{} products downloaded".format(i + 1, len(products)))
+        try:
+            products_info = self.get_products_info([product['id'] for product in products])
+        except (SentinelAPIError, requests.RequestException) as e:
+            # the products will be looked up one by one with retries
+            print("Could not get the info of all products:\n{}".format(str(e)))
+            products_info = {}
+
+        def download_product(product):
+            return self._download_with_retries(product, directory_path, max_attempts, checksum,
+                                               check_existing or product['id'] in unverified,
+                                               product_info=products_info.get(product['id']), **kwargs)
+
+        pool = None
+        if max_workers > 1 and len(products) > 1:
+            pool = ThreadPool(min(max_workers, len(products)))
+            downloads = pool.imap_unordered(download_product, products)
+        else:
+            downloads = (download_product(product) for product in products)
+        try:
+            for i, (path, product_info) in enumerate(downloads):
+                result[path] = product_info
+                print("{}/{} products downloaded".format(i + 1, len(products)))
+        finally:
+            if pool is not None:
+                pool.terminate()
         return result
 
+    def _download_with_retries(self, product, directory_path, max_attempts, checksum, check_existing, **kwargs):
+        """Download a product of the query results, attempting it at most max_attempts times.
+
+        Corrupted downloads are retried immediately, other errors after the delay of the retry policy.
+
+        Returns the path and product info like download(). The product info is None if all attempts failed,
+        the error of the last attempt is then kept in self.failed_downloads.
+        """
+        path = join(directory_path, product['title'] + '.zip')
+        total_wait = 0
+        error = None
+        for attempt in range(max_attempts):
+            try:
+                return self.download(product['id'], directory_path, checksum, check_existing, **kwargs)
+            except (KeyboardInterrupt, SystemExit, SystemError, MemoryError):
+                raise
+            except InvalidChecksumError as e:
+                print("Invalid checksum. The downloaded file is corrupted.")
+                error = e
+                continue
+            except Exception as e:
+                error = e
+                print("There was an error downloading %s" % product['title'], file=sys.stderr)
+                traceback.print_exc()
+                if self.retry_policy.is_permanent(e):
+                    break
+                delay = self.retry_policy.delay(attempt, e)
+            if attempt + 1 < max_attempts:
+                if total_wait + delay > self.retry_policy.max_total_wait:
+                    break
+                sleep(delay)
+                total_wait += delay
+        self.failed_downloads[path] = error
+        return path, None
+
+    def _fillin_timeout(self, kwargs_dict):
+        """Fill in the pycurl options applying the timeout of the API object to homura downloads.
+
+        pycurl has no read timeout, a transfer receiving less than one byte per second during
+        the read timeout is aborted instead. Options given by the user are kept.
+        """
+        if self.timeout is None:
+            return kwargs_dict
+        import pycurl
+        connect, read = self.timeout if isinstance(self.timeout, tuple) else (self.timeout, self.timeout)
+        pass_through_opts = kwargs_dict.setdefault('pass_through_opts', {})
+        if connect is not None:
+            pass_through_opts.setdefault(pycurl.CONNECTTIMEOUT_MS, int(connect * 1000))
+        if read is not None:
+            pass_through_opts.setdefault(pycurl.LOW_SPEED_LIMIT, 1)
+            pass_through_opts.setdefault(pycurl.LOW_SPEED_TIME, max(int(-(-read // 1)), 1))
+        return kwargs_dict
+
     @staticmethod
     def _fillin_cainfo(kwargs_dict):
         """Fill in the path of the PEM file containing the CA certificate.
@@ -450,6 +1441,8 @@ class SentinelAPI(object):
         system path where libcurl's cacert bundle is assumed to be stored,
         as established at libcurl build time.
         """
+        import pycurl
+        certifi = _import_optional('certifi')
         try:
             cainfo = kwargs_dict['pass_through_opts'][pycurl.CAINFO]
         except KeyError:
@@ -486,31 +1479,75 @@ def get_coordinates(geojson_file=None, tile=None, feature_number=0):
     assert (geojson_file is not None) | (tile is not None), "Either geojson_file or tile must be provided."      
     
     if geojson_file is not None:
+        import geojson
         geojson_obj = geojson.loads(open(geojson_file, 'r').read())
         coordinates = geojson_obj['features'][feature_number]['geometry']['coordinates'][0]
         # precision of 7 decimals equals 1mm at the equator
         coordinates = ['%.7f %.7f' % tuple(coord) for coord in coordinates]
     elif tile is not None:
-        assert hasPandas, "pandas must be installed to use 'tile' option."
-        csv_file = "{0}/data/tile_centroids.csv".format( dirname(realpath(__file__)) )
-        tile_centroids = pd.read_csv(csv_file)
-        tile_subset = tile_centroids[ tile_centroids['tile'] == tile ]
-        coordinates = [ float(tile_subset['lat']), float(tile_subset['lon']) ]
-        coordinates = ['%.7f' % coord for coord in coordinates]
-        
+        coordinates = ['%.7f' % coord for coord in get_tile_centroids([tile])[tile]]
+
     return ','.join(coordinates)
 
 
-def md5_compare(file_path, checksum, block_size=2 ** 13):
+def md5_compare(file_path, checksum, block_size=2 ** 20, progress=True):
     """Compare a given md5 checksum with one calculated from a file"""
+    from tqdm import tqdm
     md5 = hashlib.md5()
     with open(file_path, "rb") as f:
-        progress = tqdm(desc="MD5 checksumming", total=getsize(file_path), unit="B", unit_scale=True)
+        progress_bar = tqdm(desc="MD5 checksumming", total=getsize(file_path), unit="B", unit_scale=True,
+                            disable=not progress)
         while True:
             block_data = f.read(block_size)
             if not block_data:
                 break
             md5.update(block_data)
-            progress.update(len(block_data))
-        progress.close()
+            progress_bar.update(len(block_data))
+        progress_bar.close()
     return md5.hexdigest().lower() == checksum.lower()
+
+
+def _md5_compare_quiet(args):
+    """md5_compare() without a progress bar, taking a (file_path, checksum, block_size) tuple."""
+    file_path, checksum, block_size = args
+    return md5_compare(file_path, checksum, block_size, progress=False)
+
+
+def verify_checksums(checksums, max_workers=None, block_size=2 ** 20):
+    """Verify the MD5 checksums of many files, checking several files at once in separate processes.
+
+    Parameters
+    ----------
+    checksums : dict[string, string]
+        Maps the path of each file to its expected MD5 checksum,
+        e.g. as returned by SentinelAPI.get_checksums()
+    max_workers : int, optional
+        Number of worker processes, defaults to the number of CPUs
+    block_size : int, optional
+        Number of bytes read at once, defaults to 1 MiB
+
+    Returns
+    -------
+    corrupt : list of string
+        Paths of the files which do not match their checksum
+    missing : list of string
+        Paths of the files which do not exist
+    """
+    missing = sorted(path for path in checksums if not exists(path))
+    present = sorted(path for path in checksums if exists(path))
+    tasks = [(path, checksums[path], block_size) for path in present]
+
+    pool = None
+    if max_workers != 1 and len(tasks) > 1:
+        pool = Pool(max_workers)
+        results = pool.imap(_md5_compare_quiet, tasks)
+    else:
+        results = (_md5_compare_quiet(task) for task in tasks)
+    from tqdm import tqdm
+    try:
+        matches = list(tqdm(results, desc="Verifying checksums", total=len(tasks), unit="file"))
+    finally:
+        if pool is not None:
+            pool.terminate()
+    corrupt = [path for path, match in zip(present, matches) if not match]
+    return corrupt, missing
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""Lookup of the Sentinel-2 tile centroids shipped in sentinelsat/data/tile_centroids.csv."""
+import csv
+import math
+import threading
+from array import array
+from os.path import dirname, join, realpath
+
+TILE_CENTROIDS_CSV = join(dirname(realpath(__file__)), 'data', 'tile_centroids.csv')
+
+# Sentinel-2 tiles are 109.8 km squares, half of it in degrees of latitude
+TILE_HALF_SIZE = 109.8 / 2 / 111.2
+# cell size in degrees of the grid used for the spatial index
+GRID_CELL_SIZE = 1.0
+
+_tile_index = None
+_tile_index_lock = threading.Lock()
+
+
+class TileIndex(object):
+    """Array-backed table of the tile centroids with an index by tile ID.
+
+    Tiles crossing the antimeridian are listed with one centroid on each side of it.
+    Lookups by tile ID return the first one.
+
+    Attributes
+    ----------
+    tiles : list of string
+        Tile ID of each centroid
+    lats, lons : array.array of float
+        Latitude and longitude of each centroid
+    """
+
+    def __init__(self, csv_file=TILE_CENTROIDS_CSV):
+        self.tiles = []
+        self.lats = array('d')
+        self.lons = array('d')
+        self._rows = {}
+        self._grid = None
+        with open(csv_file) as f:
+            reader = csv.reader(f)
+            next(reader)  # header: FID, tile, lat, lon
+            for _, tile, lat, lon in reader:
+                self._rows.setdefault(tile, len(self.tiles))
+                self.tiles.append(tile)
+                self.lats.append(float(lat))
+                self.lons.append(float(lon))
+
+    def __contains__(self, tile):
+        return tile in self._rows
+
+    def __len__(self):
+        return len(self._rows)
+
+    def centroid(self, tile):
+        """Return the (lat, lon) centroid of a tile. Raises KeyError for unknown tiles."""
+        row = self._rows[tile]
+        return self.lats[row], self.lons[row]
+
+    def _build_grid(self):
+        """Bucket the centroids into a grid of GRID_CELL_SIZE degree cells."""
+        self._grid = {}
+        for row, (lat, lon) in enumerate(zip(self.lats, self.lons)):
+            self._grid.setdefault(_grid_cell(lat, lon), []).append(row)
+
+    def _tile_box(self, row):
+        """Approximate (min_lon, min_lat, max_lon, max_lat) extent of the tile of a centroid."""
+        lat, lon = self.lats[row], self.lons[row]
+        half_lon = min(TILE_HALF_SIZE / max(math.cos(math.radians(lat)), 0.01), 180)
+        return lon - half_lon, lat - TILE_HALF_SIZE, lon + half_lon, lat + TILE_HALF_SIZE
+
+    def find_tiles(self, area):
+        """Return the IDs of the tiles covering an area.
+
+        The tile extents are approximated from the centroids, assuming squares of 109.8 km.
+        Areas crossing the antimeridian are not supported.
+
+        Parameters
+        ----------
+        area : tuple or dict
+            Either a (min_lon, min_lat, max_lon, max_lat) bounding box or a GeoJSON
+            Polygon or MultiPolygon geometry, or a Feature containing one
+
+        Returns
+        -------
+        list of string
+            Sorted IDs of the tiles intersecting the area
+        """
+        if self._grid is None:
+            self._build_grid()
+        polygons = _area_polygons(area)
+        tiles = set()
+        for polygon in polygons:
+            min_lon, min_lat, max_lon, max_lat = _bounds(polygon[0])
+            # extend the search by the tile size, centroids outside of the area can still cover it
+            max_abs_lat = min(max(abs(min_lat), abs(max_lat)) + TILE_HALF_SIZE, 89.9)
+            lon_margin = min(TILE_HALF_SIZE / math.cos(math.radians(max_abs_lat)), 180)
+            min_cell = _grid_cell(min_lat - TILE_HALF_SIZE, min_lon - lon_margin)
+            max_cell = _grid_cell(max_lat + TILE_HALF_SIZE, max_lon + lon_margin)
+            for cell_lat in range(min_cell[0], max_cell[0] + 1):
+                for cell_lon in range(min_cell[1], max_cell[1] + 1):
+                    for row in self._grid.get((cell_lat, cell_lon), []):
+                        if self.tiles[row] not in tiles and _box_intersects_polygon(self._tile_box(row), polygon):
+                            tiles.add(self.tiles[row])
+        return sorted(tiles)
+
+
+def get_tile_index():
+    """Return the TileIndex of the tile centroids, loading it on first use."""
+    global _tile_index
+    if _tile_index is None:
+        with _tile_index_lock:
+            if _tile_index is None:
+                _tile_index = TileIndex()
+    return _tile_index
+
+
+def get_tile_centroids(tiles):
+    """Return the centroids of many Sentinel-2 tiles.
+
+    Parameters
+    ----------
+    tiles : list of string
+        Sentinel-2 tile IDs, e.g. ['33UUP', '33UVP']
+
+    Returns
+    -------
+    dict[string, tuple]
+        Maps each tile ID to its (lat, lon) centroid
+
+    Raises
+    ------
+    ValueError
+        If a tile ID is unknown
+    """
+    index = get_tile_index()
+    unknown = [tile for tile in tiles if tile not in index]
+    if unknown:
+        raise ValueError("Unknown Sentinel-2 tile(s): %s" % ', '.join(unknown))
+    return dict((tile, index.centroid(tile)) for tile in tiles)
+
+
+def find_tiles(area):
+    """Return the IDs of the Sentinel-2 tiles covering an area, see TileIndex.find_tiles()."""
+    return get_tile_index().find_tiles(area)
+
+
+def _grid_cell(lat, lon):
+    return int(math.floor(lat / GRID_CELL_SIZE)), int(math.floor(lon / GRID_CELL_SIZE))
+
+
+def _area_polygons(area):
+    """Return the polygons of an area as lists of rings of (lon, lat) coordinates."""
+    if isinstance(area, (tuple, list)):
+        min_lon, min_lat, max_lon, max_lat = area
+        return [[[(min_lon, min_lat), (max_lon, min_lat), (max_lon, max_lat), (min_lon, max_lat)]]]
+    if area.get('type') == 'Feature':
+        area = area['geometry']
+    if area['type'] == 'Polygon':
+        polygons = [area['coordinates']]
+    elif area['type'] == 'MultiPolygon':
+        polygons = area['coordinates']
+    else:
+        raise ValueError("Area must be a bounding box or a Polygon or MultiPolygon geometry.")
+    return [[[tuple(coord[:2]) for coord in ring] for ring in polygon] for polygon in polygons]
+
+
+def _bounds(ring):
+    lons = [coord[0] for coord in ring]
+    lats = [coord[1] for coord in ring]
+    return min(lons), min(lats), max(lons), max(lats)
+
+
+def _point_in_polygon(x, y, polygon):
+    """Even-odd rule test of a point against a polygon given as a list of rings."""
+    inside = False
+    for ring in polygon:
+        for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+            if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+    return inside
+
+
+def _segments_intersect(p1, p2, q1, q2):
+    def orientation(a, b, c):
+        return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+    d1 = orientation(q1, q2, p1)
+    d2 = orientation(q1, q2, p2)
+    d3 = orientation(p1, p2, q1)
+    d4 = orientation(p1, p2, q2)
+    return (d1 > 0) != (d2 > 0) and (d3 > 0) != (d4 > 0)
+
+
+def _box_intersects_polygon(box, polygon):
+    """Test whether a (min_x, min_y, max_x, max_y) box intersects a polygon."""
+    min_x, min_y, max_x, max_y = box
+    p_min_x, p_min_y, p_max_x, p_max_y = _bounds(polygon[0])
+    if p_max_x < min_x or p_min_x > max_x or p_max_y < min_y or p_min_y > max_y:
+        return False
+    corners = [(min_x, min_y), (max_x, min_y), (max_x, max_y), (min_x, max_y)]
+    # the box is inside the polygon
+    if _point_in_polygon(min_x, min_y, polygon):
+        return True
+    # the polygon is inside the box
+    x, y = polygon[0][0]
+    if min_x <= x <= max_x and min_y <= y <= max_y:
+        return True
+    # the boundaries cross
+    box_edges = list(zip(corners, corners[1:] + corners[:1]))
+    for ring in polygon:
+        for q1, q2 in zip(ring, ring[1:] + ring[:1]):
+            for p1, p2 in box_edges:
+                if _segments_intersect(p1, p2, q1, q2):
+                    return True
+    return False
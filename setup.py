@@ -37,6 +37,12 @@ setup(name='sentinelsat',
               'pytest',
               'requests-mock'
           ],
+          'async': [
+              'aiohttp'
+          ],
+          'stream': [
+              'ijson'
+          ],
       },
       entry_points="""
       [console_scripts]
@@ -0,0 +1,117 @@
+import asyncio
+import hashlib
+
+import pytest
+
+from sentinelsat.sentinel import InvalidChecksumError, SentinelAPIError
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web  # noqa: E402
+
+from sentinelsat.aio import AsyncSentinelAPI  # noqa: E402
+
+CONTENT = b'sentinel' * 1000
+
+PRODUCT_JSON = {"d": {
+    "Id": "uuid",
+    "Name": "product",
+    "ContentLength": str(len(CONTENT)),
+    "Checksum": {"Value": hashlib.md5(CONTENT).hexdigest().upper()},
+    "ContentDate": {"Start": "/Date(1445588544652)/"},
+    "ContentGeometry": '<gml:Polygon xmlns:gml="http://www.opengis.net/gml"><gml:outerBoundaryIs><gml:LinearRing>'
+                       '<gml:coordinates>0,0 0,1 1,1 0,0</gml:coordinates></gml:LinearRing></gml:outerBoundaryIs>'
+                       '</gml:Polygon>'
+}}
+
+
+CAPPED_IDS = [str(i) for i in range(9)]
+
+# concurrent search requests of the "capped" query
+searches = {'active': 0, 'peak': 0}
+
+
+async def _hub(request):
+    if request.path.endswith('/search'):
+        start = int(request.query['start'])
+        if (await request.post())['q'] == 'capped':
+            # returns fewer rows than requested, the later pages even fewer
+            searches['active'] += 1
+            searches['peak'] = max(searches['peak'], searches['active'])
+            await asyncio.sleep(0.01)
+            searches['active'] -= 1
+            ids = CAPPED_IDS[start:start + (2 if start == 0 else 1)]
+            entries = [{"id": id, "title": "product_" + id} for id in ids]
+            return web.json_response({"feed": {"opensearch:totalResults": str(len(CAPPED_IDS)),
+                                               "entry": entries}})
+        ids = ['a', 'b', 'c'][start:start + int(request.query['rows'])]
+        entries = [{"id": id, "title": "product_" + id} for id in ids]
+        return web.json_response({"feed": {"opensearch:totalResults": "3", "entry": entries}})
+    if "Products('missing')" in request.path_qs:
+        return web.json_response({"error": {"code": None, "message": {"value": "No Products found"}}},
+                                 status=500)
+    if request.path.endswith('$value'):
+        if 'Range' in request.headers:
+            start = int(request.headers['Range'].replace('bytes=', '').rstrip('-'))
+            return web.Response(body=CONTENT[start:], status=206)
+        return web.Response(body=CONTENT)
+    return web.json_response(PRODUCT_JSON)
+
+
+def _run_with_hub(test):
+    async def run():
+        server = web.Server(_hub)
+        runner = web.ServerRunner(server)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            async with AsyncSentinelAPI('user', 'password', 'http://127.0.0.1:%d/apihub' % port,
+                                        page_size=2) as api:
+                await test(api)
+        finally:
+            await runner.cleanup()
+    asyncio.run(run())
+
+
+@pytest.mark.fast
+def test_async_query():
+    async def test(api):
+        products = await api.query_raw("dummy query")
+        assert [product["id"] for product in products] == ["a", "b", "c"]
+        assert [product["id"] async for product in api.iter_products("dummy query")] == ["a", "b", "c"]
+
+        # short pages are completed and at most max_workers pages are requested at a time
+        products = await api.query_raw("capped", max_workers=2)
+        assert [product["id"] for product in products] == CAPPED_IDS
+        assert searches['peak'] == 2
+
+    _run_with_hub(test)
+
+
+@pytest.mark.fast
+def test_async_download(tmpdir):
+    async def test(api):
+        product_info = await api.get_product_info('uuid')
+        assert product_info['size'] == len(CONTENT)
+        assert product_info['date'] == '2015-10-23T08:22:24Z'
+        with pytest.raises(SentinelAPIError) as excinfo:
+            await api.get_product_info('missing')
+        assert excinfo.value.msg == "No Products found"
+
+        path, _ = await api.download('uuid', str(tmpdir), checksum=True)
+        assert tmpdir.join("product.zip").read_binary() == CONTENT
+
+        tmpdir.join("product.zip").write_binary(CONTENT[:100])
+        await api.download('uuid', str(tmpdir), checksum=True)
+        assert tmpdir.join("product.zip").read_binary() == CONTENT
+
+        tmpdir.join("product.zip").write_binary(b'x' * 100)
+        with pytest.raises(InvalidChecksumError):
+            await api.download('uuid', str(tmpdir), checksum=True)
+        # the corrupt file is removed, the next attempt downloads it again
+        assert not tmpdir.join("product.zip").check()
+        await api.download('uuid', str(tmpdir), checksum=True)
+        assert tmpdir.join("product.zip").read_binary() == CONTENT
+
+    _run_with_hub(test)
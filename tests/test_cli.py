@@ -1,9 +1,16 @@
+import hashlib
+import json
+import subprocess
+import sys
+import textwrap
+
 from click.testing import CliRunner
 
 from os import environ
 import pytest
 
 from sentinelsat.scripts.cli import cli
+from sentinelsat.sentinel import InvalidChecksumError, SentinelAPI, SentinelAPIError
 
 
 @pytest.mark.scihub
@@ -128,3 +135,69 @@ def test_sentinel2_flag():
 
     expected = "Product 91c2503c-3c58-4a8c-a70b-207b128e6833 - Date: 2015-12-27T14:22:29Z, Instrument: MSI, Mode: , Satellite: Sentinel-2, Size: 5.73 GB"
     assert result.output.split("\n")[2] == expected
+
+
+@pytest.mark.fast
+def test_search_download_report(tmpdir, monkeypatch):
+    products = [{"id": id, "title": id} for id in ["valid", "corrupt", "failed"]]
+
+    def query(self, **kwargs):
+        self.products = products
+
+    def download(self, id, directory_path, checksum, check_existing, **kwargs):
+        if id == "corrupt":
+            raise InvalidChecksumError('File corrupt: checksums do not match')
+        if id == "failed":
+            # a partial file is left by the failed download
+            tmpdir.join("failed.zip").write_binary(b'partial')
+            raise SentinelAPIError(404, msg="not found")
+        return str(tmpdir.join("valid.zip")), {"id": id}
+
+    monkeypatch.setattr(SentinelAPI, "query", query)
+    monkeypatch.setattr(SentinelAPI, "download", download)
+    monkeypatch.setattr(SentinelAPI, "get_products_info", lambda self, ids: {})
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ['search', 'user', 'password', '--geojson', 'tests/map.geojson', '--download',
+                                 '--md5', '--path', str(tmpdir)])
+    assert result.exit_code == 0
+    assert tmpdir.join("corrupt_scenes.txt").read().splitlines() == [
+        "corrupt : %s" % tmpdir.join("corrupt.zip"),
+        "missing : %s" % tmpdir.join("failed.zip")
+    ]
+
+
+@pytest.mark.fast
+def test_verify(tmpdir, monkeypatch):
+    valid = tmpdir.join("valid.zip")
+    valid.write_binary(b'valid')
+    tmpdir.join("corrupt.zip").write_binary(b'corrupt')
+    tmpdir.join("unknown.zip").write_binary(b'unknown')
+    checksums = {
+        str(valid): hashlib.md5(b'valid').hexdigest(),
+        str(tmpdir.join("corrupt.zip")): hashlib.md5(b'valid').hexdigest()
+    }
+    monkeypatch.setattr(SentinelAPI, "get_checksums", lambda self, paths: checksums)
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ['verify', 'user', 'password', str(tmpdir), '--workers', '1'])
+    assert result.exit_code == 0
+    assert tmpdir.join("corrupt_scenes.txt").read().splitlines() == [
+        "corrupt : %s" % tmpdir.join("corrupt.zip"),
+        "unknown : %s" % tmpdir.join("unknown.zip")
+    ]
+
+
+@pytest.mark.fast
+def test_import_time():
+    # import in a fresh interpreter, the test session has loaded everything already
+    script = textwrap.dedent("""
+        import json, sys
+        import sentinelsat.scripts.cli
+        heavy = ['pandas', 'numpy', 'pycurl', 'homura', 'html2text', 'geojson', 'tqdm', 'ijson']
+        print(json.dumps([name for name in heavy if name in sys.modules]))
+        """)
+    output = subprocess.check_output([sys.executable, '-W', 'ignore', '-c', script])
+    loaded = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+    # the heavy dependencies are only loaded by the commands and functions using them
+    assert loaded == []
@@ -1,6 +1,9 @@
 import hashlib
+import sys
 import textwrap
+import time
 from datetime import date, datetime, timedelta
+from multiprocessing.pool import ThreadPool
 from os import environ
 
 import geojson
@@ -8,8 +11,19 @@ import py.path
 import pytest
 import requests_mock
 
+try:
+    from urlparse import parse_qs
+except ImportError:
+    from urllib.parse import parse_qs
+
+from sentinelsat.cache import ProductInfoCache
+from sentinelsat.footprints import parse_footprints
+from sentinelsat.inventory import DownloadInventory
+from sentinelsat.ratelimit import RateLimiter
+from sentinelsat.retry import RetryPolicy
+from sentinelsat.tiles import find_tiles, get_tile_centroids
 from sentinelsat.sentinel import (InvalidChecksumError, SentinelAPI, SentinelAPIError, convert_timestamp, format_date,
-                                  get_coordinates, md5_compare)
+                                  get_coordinates, md5_compare, verify_checksums)
 
 
 @pytest.mark.fast
@@ -422,6 +436,840 @@ def test_download_all(tmpdir):
         json = api.session.get(url).json()
         json["d"]["Checksum"]["Value"] = "00000000000000000000000000000000"
         rqst.get(url, json=json)
+        # let the batch request fail, the product info is then requested one by one
+        rqst.get("https://scihub.copernicus.eu/apihub/odata/v1/Products", status_code=500)
         result = api.download_all(str(tmpdir), max_attempts=1, checksum=True)
         assert len(result) == len(filenames)
         assert result[path] is None
+
+
+def _opensearch_page(ids, total):
+    entries = [{"id": id, "title": "product_%s" % id, "summary": ""} for id in ids]
+    return {"feed": {"opensearch:totalResults": str(total), "entry": entries[0] if len(entries) == 1 else entries}}
+
+
+@pytest.mark.mock_api
+def test_query_pagination():
+    api = SentinelAPI("mock_user", "mock_password", page_size=2)
+    assert api.url == 'https://scihub.copernicus.eu/apihub/search?format=json&rows=2'
+    with requests_mock.mock() as rqst:
+        rqst.post(api._format_url(0), json=_opensearch_page(["a", "b"], 3))
+        rqst.post(api._format_url(2), json=_opensearch_page(["c"], 3))
+        api.query_raw("dummy query")
+        assert [product["id"] for product in api.get_products()] == ["a", "b", "c"]
+        assert rqst.call_count == 2
+
+        # pages are only requested once they are needed
+        products = api.iter_products()
+        assert next(products)["id"] == "a"
+        assert rqst.call_count == 3
+        assert [product["id"] for product in products] == ["b", "c"]
+        assert rqst.call_count == 4
+
+        rqst.post(api._format_url(0), json={"feed": {"opensearch:totalResults": "0"}})
+        api.query_raw("empty query")
+        assert api.get_products() == []
+
+
+@pytest.mark.mock_api
+def test_iter_products_stream():
+    pytest.importorskip("ijson")
+    api = SentinelAPI("mock_user", "mock_password", page_size=2)
+    with requests_mock.mock() as rqst:
+        rqst.post(api._format_url(0), json=_opensearch_page(["a", "b"], 3))
+        # a single entry is returned as a dict
+        rqst.post(api._format_url(2), json=_opensearch_page(["c"], 3))
+        products = list(api.iter_products("dummy query", stream=True))
+        assert products == list(api.iter_products("dummy query"))
+        assert [product["id"] for product in products] == ["a", "b", "c"]
+
+        rqst.post(api._format_url(0), text="<html>Maintenance</html>")
+        with pytest.raises(SentinelAPIError):
+            list(api.iter_products("dummy query", stream=True))
+        rqst.post(api._format_url(0), status_code=401, text="Unauthorized")
+        with pytest.raises(SentinelAPIError) as excinfo:
+            list(api.iter_products("dummy query", stream=True))
+        assert excinfo.value.http_status == 401
+
+
+@pytest.mark.mock_api
+def test_query_pages_parallel():
+    api = SentinelAPI("mock_user", "mock_password", page_size=2)
+    with requests_mock.mock() as rqst:
+        rqst.post(api._format_url(0), json=_opensearch_page(["a", "b"], 7))
+        rqst.post(api._format_url(2), json=_opensearch_page(["c", "d"], 7))
+        # overlapping page, e.g. because a product was added in the meantime
+        rqst.post(api._format_url(4), json=_opensearch_page(["d", "e"], 7))
+        rqst.post(api._format_url(6), json=_opensearch_page(["f"], 7))
+        api.query_raw("dummy query", max_workers=3)
+        assert [product["id"] for product in api.get_products()] == ["a", "b", "c", "d", "e", "f"]
+        assert rqst.call_count == 4
+
+    # each worker decodes its own page, also when threads switch often
+    ids = [str(i) for i in range(40)]
+
+    def page(request, context):
+        start = int(parse_qs(request.query)["start"][0])
+        return _opensearch_page(ids[start:start + 2], len(ids))
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with requests_mock.mock() as rqst:
+            rqst.post(requests_mock.ANY, json=page)
+            for _ in range(30):
+                api.query_raw("dummy query", max_workers=16)
+                assert [product["id"] for product in api.get_products()] == ids
+    finally:
+        sys.setswitchinterval(interval)
+
+
+@pytest.mark.mock_api
+def test_query_pages_parallel_capped_rows():
+    api = SentinelAPI("mock_user", "mock_password", page_size=4)
+    ids = [str(i) for i in range(10)]
+
+    def capped_page(request, context):
+        # the server returns fewer rows than requested
+        start = int(parse_qs(request.query)["start"][0])
+        return _opensearch_page(ids[start:start + 2], len(ids))
+
+    with requests_mock.mock() as rqst:
+        rqst.post(requests_mock.ANY, json=capped_page)
+        api.query_raw("dummy query", max_workers=3)
+        assert [product["id"] for product in api.get_products()] == ids
+        assert [product["id"] for product in api.iter_products()] == ids
+
+        # later pages shorter than the first one
+        pages = {0: 4, 4: 3, 7: 3}
+
+        def uneven_page(request, context):
+            start = int(parse_qs(request.query)["start"][0])
+            return _opensearch_page(ids[start:start + pages.get(start, 1)], len(ids))
+
+        rqst.post(requests_mock.ANY, json=uneven_page)
+        api.query_raw("dummy query", max_workers=3)
+        assert [product["id"] for product in api.get_products()] == ids
+
+
+@pytest.mark.fast
+def test_download_all_parallel(tmpdir, monkeypatch):
+    api = SentinelAPI("mock_user", "mock_password", max_concurrent_downloads=2)
+    api.products = [{"id": str(i), "title": "product_%d" % i} for i in range(5)]
+
+    def mock_download(id, directory_path, checksum, check_existing, **kwargs):
+        if id == "3":
+            raise InvalidChecksumError()
+        return str(tmpdir.join("product_%s.zip" % id)), {"id": id}
+
+    monkeypatch.setattr(api, "download", mock_download)
+    monkeypatch.setattr(api, "get_products_info", lambda ids: {})
+    result = api.download_all(str(tmpdir), max_attempts=2, max_workers=4)
+    assert len(result) == 5
+    for i in range(5):
+        path = str(tmpdir.join("product_%d.zip" % i))
+        assert result[path] == (None if i == 3 else {"id": str(i)})
+
+
+@pytest.mark.fast
+def test_retry_policy(monkeypatch):
+    delays = []
+    monkeypatch.setattr(time, "sleep", delays.append)
+    policy = RetryPolicy(max_attempts=4, backoff=1, max_backoff=3, max_total_wait=100, jitter=False)
+    assert [policy.delay(attempt) for attempt in range(4)] == [1, 2, 3, 3]
+    assert policy.delay(0, SentinelAPIError(503, headers={"Retry-After": "2"})) == 2
+    assert policy.is_retryable(SentinelAPIError(429))
+    assert not policy.is_retryable(SentinelAPIError(404))
+    assert policy.is_permanent(SentinelAPIError(401))
+    assert not policy.is_permanent(SentinelAPIError(500))
+
+    errors = [SentinelAPIError(503, msg="busy"), SentinelAPIError(429, msg="slow down", headers={"Retry-After": "0"})]
+
+    def flaky():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert policy.call(flaky) == "ok"
+    assert delays == [1, 0]
+
+    # permanent errors are raised at once
+    def not_found():
+        raise SentinelAPIError(404, msg="not found")
+
+    with pytest.raises(SentinelAPIError):
+        policy.call(not_found)
+    assert delays == [1, 0]
+
+    # the total wait time is capped
+    policy.max_total_wait = 2
+
+    def unavailable():
+        raise SentinelAPIError(503, msg="busy")
+
+    with pytest.raises(SentinelAPIError):
+        policy.call(unavailable)
+    assert delays == [1, 0, 1]
+
+
+@pytest.mark.mock_api
+def test_query_retries_throttled_requests(monkeypatch):
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+    api = SentinelAPI("mock_user", "mock_password", retry_policy=RetryPolicy(max_attempts=3))
+    with requests_mock.mock() as rqst:
+        rqst.post(api._format_url(0), [
+            {"status_code": 429, "text": "Too Many Requests", "headers": {"Retry-After": "1"}},
+            {"status_code": 503, "text": "Service Unavailable"},
+            {"json": _opensearch_page(["a"], 1)}])
+        api.query_raw("dummy query")
+        assert [product["id"] for product in api.get_products()] == ["a"]
+        assert rqst.call_count == 3
+
+        rqst.post(api._format_url(0), status_code=503, text="Service Unavailable")
+        with pytest.raises(SentinelAPIError) as excinfo:
+            api.query_raw("dummy query")
+        assert excinfo.value.http_status == 503
+        assert rqst.call_count == 6
+
+
+@pytest.mark.fast
+def test_rate_limiter():
+    limiter = RateLimiter(requests_per_second=50, burst=2)
+    start = time.time()
+    for _ in range(7):
+        limiter.acquire()
+    # the burst is sent at once, the remaining 5 requests at the limited rate
+    assert time.time() - start >= 0.09
+
+
+@pytest.mark.fast
+def test_download_connections_limit(tmpdir):
+    api = SentinelAPI("mock_user", "mock_password", max_concurrent_downloads=3)
+    assert api.rate_limiter.max_concurrent_downloads == 3
+    # the connections are counted across all API objects sharing a rate limiter
+    limiter = RateLimiter(max_concurrent_downloads=3)
+    apis = [SentinelAPI("mock_user", "mock_password", rate_limiter=limiter) for _ in range(2)]
+    assert apis[0].max_concurrent_downloads == 3
+    active = []
+    peak = []
+
+    def download(args):
+        api, connections = args
+        with api._download_slot(connections):
+            active.append(connections)
+            peak.append(sum(active))
+            time.sleep(0.01)
+            active.remove(connections)
+
+    # each segment of a download counts as a connection
+    pool = ThreadPool(6)
+    pool.map(download, [(apis[i % 2], connections) for i, connections in enumerate([1, 2, 3] * 4)])
+    pool.terminate()
+    assert max(peak) == 3
+
+    with pytest.raises(ValueError):
+        with api._download_slot(4):
+            pass
+    api.products = [{"id": "0", "title": "product_0"}]
+    with pytest.raises(ValueError):
+        api.download_all(str(tmpdir), segments=4)
+
+
+@pytest.mark.mock_api
+def test_rate_limited_queries(monkeypatch):
+    api = SentinelAPI("mock_user", "mock_password", page_size=1,
+                      rate_limiter=RateLimiter(requests_per_second=1))
+    acquired = []
+    monkeypatch.setattr(api.rate_limiter, "acquire", lambda: acquired.append(1))
+    with requests_mock.mock() as rqst:
+        for start in range(3):
+            rqst.post(api._format_url(start), json=_opensearch_page([str(start)], 3))
+        api.query_raw("dummy query", max_workers=2)
+        assert len(acquired) == rqst.call_count == 3
+
+
+@pytest.mark.fast
+def test_download_all_backoff(tmpdir, monkeypatch):
+    delays = []
+    monkeypatch.setattr("sentinelsat.sentinel.sleep", delays.append)
+    api = SentinelAPI("mock_user", "mock_password", retry_policy=RetryPolicy(backoff=1, jitter=False))
+    api.products = [{"id": "1", "title": "product_1"}, {"id": "2", "title": "product_2"}]
+    attempts = []
+
+    def mock_download(id, directory_path, checksum, check_existing, **kwargs):
+        attempts.append(id)
+        if id == "1":
+            raise SentinelAPIError(503, msg="Service Unavailable")
+        raise SentinelAPIError(404, msg="Not Found")
+
+    monkeypatch.setattr(api, "download", mock_download)
+    monkeypatch.setattr(api, "get_products_info", lambda ids: {})
+    result = api.download_all(str(tmpdir), max_attempts=3)
+    assert list(result.values()) == [None, None]
+    # permanent errors are not retried
+    assert attempts == ["1", "1", "1", "2"]
+    assert delays == [1, 2]
+
+
+@pytest.mark.mock_api
+def test_download_segmented(tmpdir, monkeypatch):
+    api = SentinelAPI("mock_user", "mock_password", max_concurrent_downloads=3)
+    content = bytes(bytearray(i % 251 for i in range(1000)))
+    product_info = {
+        'id': 'uuid', 'title': 'product', 'size': len(content),
+        'md5': hashlib.md5(content).hexdigest(),
+        'url': "https://scihub.copernicus.eu/apihub/odata/v1/Products('uuid')/$value"
+    }
+    monkeypatch.setattr(api, "get_product_info", lambda id: product_info)
+    requested_ranges = []
+
+    def range_response(request, context):
+        start, end = map(int, request.headers['Range'].replace('bytes=', '').split('-'))
+        requested_ranges.append((start, end))
+        context.status_code = 206
+        return content[start:end + 1]
+
+    expected_path = tmpdir.join("product.zip")
+    with requests_mock.mock() as rqst:
+        rqst.get(product_info['url'], content=range_response)
+        path, _ = api.download('uuid', str(tmpdir), checksum=True, segments=3)
+        assert expected_path.samefile(path)
+        assert expected_path.read_binary() == content
+        assert sorted(requested_ranges) == [(0, 333), (334, 667), (668, 999)]
+        assert not tmpdir.join("product.zip.segments").check()
+
+        # resume an interrupted download: only the missing range is fetched
+        expected_path.write_binary(content[:334] + b'\0' * 334 + content[668:])
+        tmpdir.join("product.zip.segments").write('{"segment_size": 334, "completed": [0, 2]}')
+        requested_ranges[:] = []
+        api.download('uuid', str(tmpdir), checksum=True, segments=3)
+        assert requested_ranges == [(334, 667)]
+        assert expected_path.read_binary() == content
+
+        # a partial non-segmented download is continued
+        expected_path.write_binary(content[:700])
+        requested_ranges[:] = []
+        api.download('uuid', str(tmpdir), checksum=True, segments=3)
+        assert requested_ranges == [(668, 999)]
+        assert expected_path.read_binary() == content
+
+        # an interrupted segmented download is resumed by its ranges also without segments
+        expected_path.write_binary(content[:334] + b'\0' * 666)
+        tmpdir.join("product.zip.segments").write('{"segment_size": 334, "completed": [0]}')
+        requested_ranges[:] = []
+        api.download('uuid', str(tmpdir), checksum=True)
+        assert requested_ranges == [(334, 667), (668, 999)]
+        assert expected_path.read_binary() == content
+        assert not tmpdir.join("product.zip.segments").check()
+        api.download('uuid', str(tmpdir), checksum=True)
+        assert rqst.call_count == 7
+
+
+@pytest.mark.fast
+def test_download_homura_timeout(tmpdir, monkeypatch):
+    homura = pytest.importorskip("homura")
+    pycurl = pytest.importorskip("pycurl")
+    api = SentinelAPI("mock_user", "mock_password", timeout=(5, 60.5))
+    product_info = {'id': 'uuid', 'title': 'product', 'size': 10, 'md5': '',
+                    'url': "https://scihub.copernicus.eu/apihub/odata/v1/Products('uuid')/$value"}
+    options = []
+    monkeypatch.setattr(homura, "download", lambda url, path, session, **kwargs: options.append(
+        kwargs['pass_through_opts']))
+    api.download('uuid', str(tmpdir), product_info=product_info)
+    assert options[0][pycurl.CONNECTTIMEOUT_MS] == 5000
+    assert options[0][pycurl.LOW_SPEED_LIMIT] == 1
+    assert options[0][pycurl.LOW_SPEED_TIME] == 61
+
+    # options of the user are kept
+    api.download('uuid', str(tmpdir), product_info=product_info,
+                 pass_through_opts={pycurl.LOW_SPEED_TIME: 600})
+    assert options[1][pycurl.LOW_SPEED_TIME] == 600
+
+
+@pytest.mark.mock_api
+def test_download_inline_checksum(tmpdir, monkeypatch):
+    api = SentinelAPI("mock_user", "mock_password")
+    content = b'sentinel' * 1000
+    product_info = {
+        'id': 'uuid', 'title': 'product', 'size': len(content),
+        'md5': hashlib.md5(content).hexdigest().upper(),
+        'url': "https://scihub.copernicus.eu/apihub/odata/v1/Products('uuid')/$value"
+    }
+    monkeypatch.setattr(api, "get_product_info", lambda id: product_info)
+
+    def response(request, context):
+        if 'Range' not in request.headers:
+            return content
+        start = int(request.headers['Range'].replace('bytes=', '').rstrip('-'))
+        context.status_code = 206
+        return content[start:]
+
+    expected_path = tmpdir.join("product.zip")
+    with requests_mock.mock() as rqst:
+        rqst.get(product_info['url'], content=response)
+        api.download('uuid', str(tmpdir), checksum=True)
+        assert expected_path.read_binary() == content
+
+        # continue an incomplete download
+        expected_path.write_binary(content[:100])
+        api.download('uuid', str(tmpdir), checksum=True)
+        assert rqst.last_request.headers['Range'] == 'bytes=100-'
+        assert expected_path.read_binary() == content
+
+        # corrupt existing part
+        expected_path.write_binary(b'x' * 100)
+        with pytest.raises(InvalidChecksumError):
+            api.download('uuid', str(tmpdir), checksum=True)
+        assert not expected_path.check()
+        # the next attempt downloads the file again instead of taking the corrupt one as complete
+        api.download('uuid', str(tmpdir), checksum=True)
+        assert expected_path.read_binary() == content
+
+
+@pytest.mark.fast
+def test_verify_checksums(tmpdir):
+    checksums = {}
+    for i in range(3):
+        path = tmpdir.join("product_%d.zip" % i)
+        path.write_binary(b'content %d' % i)
+        checksums[str(path)] = hashlib.md5(b'content %d' % i).hexdigest()
+    checksums[str(tmpdir.join("product_1.zip"))] = "00000000000000000000000000000000"
+    checksums[str(tmpdir.join("product_3.zip"))] = "00000000000000000000000000000000"
+
+    for max_workers in (1, 2):
+        corrupt, missing = verify_checksums(checksums, max_workers=max_workers)
+        assert corrupt == [str(tmpdir.join("product_1.zip"))]
+        assert missing == [str(tmpdir.join("product_3.zip"))]
+
+
+@pytest.mark.fast
+def test_product_info_cache(monkeypatch):
+    cache = ProductInfoCache(ttl=60, max_entries=2)
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    for id in ("a", "b"):
+        cache.set({"id": id, "title": "product_" + id, "size": 1})
+    assert cache.get("a") == {"id": "a", "title": "product_a", "size": 1}
+    assert cache.get("c") is None
+
+    # "b" is the least recently used entry
+    now[0] += 1
+    cache.get("a")
+    cache.set({"id": "c", "title": "product_c", "size": 1})
+    assert len(cache) == 2
+    assert cache.get("b") is None
+
+    now[0] += 61
+    assert cache.get("a") is None
+
+
+@pytest.mark.mock_api
+def test_download_uses_cache(tmpdir):
+    cache = ProductInfoCache(str(tmpdir.join("cache.sqlite")))
+    product_info = {'id': 'uuid', 'title': 'product', 'size': 4, 'md5': hashlib.md5(b'data').hexdigest()}
+    cache.set(product_info)
+    tmpdir.join("product.zip").write_binary(b'data')
+
+    api = SentinelAPI("mock_user", "mock_password", cache=cache)
+    with requests_mock.mock():
+        # no request is made, the mock would raise an error
+        path, info = api.download('uuid', str(tmpdir), check_existing=True)
+    assert info == product_info
+
+
+@pytest.mark.mock_api
+def test_session_options():
+    api = SentinelAPI("mock_user", "mock_password", page_size=2, pool_size=4, timeout=(3, 30),
+                      keep_alive=False, compression=False)
+    adapter = api.session.get_adapter('https://scihub.copernicus.eu/')
+    assert adapter._pool_maxsize == 4
+    assert api.session.headers['Connection'] == 'close'
+    assert api.session.headers['Accept-Encoding'] == 'identity'
+    with requests_mock.mock() as rqst:
+        rqst.post(api._format_url(0), json=_opensearch_page(["a"], 1))
+        api.query_raw("dummy query")
+        assert rqst.last_request.timeout == (3, 30)
+        assert rqst.last_request.headers['Authorization'].startswith('Basic')
+
+
+@pytest.mark.mock_api
+def test_products_decoded_once(monkeypatch):
+    api = SentinelAPI("mock_user", "mock_password")
+    page = _opensearch_page(["a"], 1)
+    page["feed"]["entry"]["str"] = {"name": "size", "content": "1 GB"}
+    with requests_mock.mock() as rqst:
+        rqst.post(api._format_url(0), json=page)
+        api.query_raw("dummy query")
+    # the stored results are used, the response is not decoded again
+    monkeypatch.setattr(api.content, "json", None)
+    products = api.get_products()
+    assert products is api.get_products()
+    assert products[0]["str"] == [{"name": "size", "content": "1 GB"}]
+    assert api.get_products_size() == 1
+
+    with requests_mock.mock() as rqst:
+        rqst.post(api._format_url(0), json=_opensearch_page([], 0))
+        api.query_raw("other query")
+    assert api.get_products() == []
+
+
+def _opensearch_entry(id, footprint, **attributes):
+    entry = {
+        "id": id, "title": "product_%s" % id, "summary": "",
+        "link": [{"href": "https://scihub.copernicus.eu/apihub/odata/v1/Products('%s')/$value" % id},
+                 {"rel": "icon", "href": "https://scihub.copernicus.eu/apihub/icon"}],
+        "date": [{"name": "beginposition", "content": "2015-12-24T09:40:34.129Z"}],
+        "str": [{"name": "footprint", "content": footprint}]
+    }
+    defaults = {"platformname": "Sentinel-1", "identifier": "product_%s" % id, "size": "1.5 GB",
+                "sensoroperationalmode": "IW", "orbitdirection": "ASCENDING", "producttype": "GRD"}
+    defaults.update(attributes)
+    for name, content in defaults.items():
+        entry["str"].append({"name": name, "content": content})
+    return entry
+
+
+@pytest.mark.fast
+def test_product_records():
+    api = SentinelAPI("mock_user", "mock_password")
+    api.products = [
+        _opensearch_entry("a", "POLYGON ((0 0,1 0,1 1,0 0))", polarisationmode="VV VH"),
+        _opensearch_entry("b", "POLYGON ((0 0,2 0,2 2,0 0))", platformname="Sentinel-2", size="512 MB")
+    ]
+    records = api._get_records()
+    assert records is api._get_records()
+    assert records[0]["polarisationmode"] == "VV VH"
+    assert "polarisationmode" not in records[1]
+    assert records[1].download_link == "https://scihub.copernicus.eu/apihub/odata/v1/Products('b')/$value"
+    assert api.get_products_size() == 2.0
+
+    footprints = api.get_footprints()
+    assert footprints["features"][0]["geometry"]["coordinates"] == [[[0, 0], [1, 0], [1, 1], [0, 0]]]
+    assert footprints["features"][0]["properties"]["polarisationmode"] == "VV VH"
+    assert footprints["features"][1]["properties"]["platformname"] == "Sentinel-2"
+    assert "polarisationmode" not in footprints["features"][1]["properties"]
+
+
+@pytest.mark.fast
+def test_footprints_multipolygon(tmpdir):
+    api = SentinelAPI("mock_user", "mock_password")
+    api.products = [
+        _opensearch_entry("a", "POLYGON ((0 0, 4 0, 4 4, 0 0), (1 1, 2 1, 2 2, 1 1))"),
+        _opensearch_entry("b", "MULTIPOLYGON (((179 0,180 0,180 1,179 0)),((-180 0,-179 0,-180 1,-180 0)))")
+    ]
+    footprints = api.get_footprints()
+    assert footprints["features"][0]["geometry"] == {
+        "type": "Polygon", "coordinates": [[[0, 0], [4, 0], [4, 4], [0, 0]], [[1, 1], [2, 1], [2, 2], [1, 1]]]}
+    assert footprints["features"][1]["geometry"]["type"] == "MultiPolygon"
+    assert footprints["features"][1]["geometry"]["coordinates"][1] == [[[-180, 0], [-179, 0], [-180, 1], [-180, 0]]]
+
+    path = str(tmpdir.join("footprints.geojson"))
+    api.write_footprints(path, batch_size=1)
+    with open(path) as f:
+        assert geojson.loads(f.read()) == footprints
+
+    with pytest.raises(ValueError):
+        parse_footprints(["POINT (0 0)"])
+    with pytest.raises(ValueError):
+        parse_footprints(["POLYGON ((0 0 1,1 0 1,1 1 1,0 0 1))"])
+
+
+@pytest.mark.fast
+def test_filter_products():
+    pytest.importorskip("numpy")
+    api = SentinelAPI("mock_user", "mock_password")
+    api.products = [
+        _opensearch_entry("full", "POLYGON ((-1 -1,3 -1,3 3,-1 3,-1 -1))", orbitdirection="ASCENDING"),
+        _opensearch_entry("half", "POLYGON ((1 -1,3 -1,3 3,1 3,1 -1))", orbitdirection="ASCENDING"),
+        _opensearch_entry("sliver", "POLYGON ((1.9 -1,3 -1,3 3,1.9 3,1.9 -1))", orbitdirection="ASCENDING"),
+        _opensearch_entry("hole", "POLYGON ((-1 -1,3 -1,3 3,-1 3,-1 -1),(0 0,1 0,1 1,0 1,0 0))",
+                          orbitdirection="DESCENDING"),
+        _opensearch_entry("outside", "MULTIPOLYGON (((10 10,11 10,11 11,10 10)),((12 12,13 12,13 13,12 12)))",
+                          orbitdirection="ASCENDING")
+    ]
+    for product, orbit in zip(api.products, ["66", "67", "66", "66", "66"]):
+        product["int"] = [{"name": "relativeorbitnumber", "content": orbit}]
+    api.products[0]["double"] = [{"name": "cloudcoverpercentage", "content": "10.0"}]
+    api.products[3]["double"] = [{"name": "cloudcoverpercentage", "content": "45.5"}]
+    area = "POLYGON ((0 0,2 0,2 2,0 2,0 0))"
+    coverage = api.get_coverage(area)
+    assert coverage["full"] == 1
+    assert coverage["half"] == pytest.approx(0.5, abs=0.02)
+    assert coverage["sliver"] == pytest.approx(0.05, abs=0.02)
+    assert coverage["hole"] == pytest.approx(0.75, abs=0.02)
+    assert coverage["outside"] == 0
+    assert api.get_coverage((0, 0, 2, 2)) == coverage
+    assert api.get_coverage("0 0,2 0,2 2,0 2,0 0") == coverage
+
+    products = api.filter_products(area, min_coverage=0.4)
+    assert [product["id"] for product in products] == ["full", "half", "hole"]
+    assert [record.id for record in api._get_records()] == ["full", "half", "hole"]
+    # int and double attributes are compared as numbers
+    products = api.filter_products(relativeorbitnumber=66)
+    assert [product["id"] for product in products] == ["full", "hole"]
+    products = api.filter_products(max_cloudcover=30)
+    assert [product["id"] for product in products] == ["full"]
+    products = api.filter_products(orbitdirection="ASCENDING")
+    assert api.get_products() is products
+    assert [product["id"] for product in products] == ["full"]
+
+
+@pytest.mark.fast
+def test_select_covering_products():
+    pytest.importorskip("numpy")
+    api = SentinelAPI("mock_user", "mock_password")
+    products = [
+        _opensearch_entry("left", "POLYGON ((0 0,1 0,1 2,0 2,0 0))", size="1 GB"),
+        _opensearch_entry("all", "POLYGON ((-1 -1,3 -1,3 3,-1 3,-1 -1))", size="10 GB"),
+        _opensearch_entry("right", "POLYGON ((1 0,2 0,2 2,1 2,1 0))", size="1 GB"),
+        _opensearch_entry("middle", "POLYGON ((0.5 0,1.5 0,1.5 2,0.5 2,0.5 0))", size="1 GB"),
+        _opensearch_entry("outside", "POLYGON ((10 10,11 10,11 11,10 10))", size="1 MB")
+    ]
+    area = (0, 0, 2, 2)
+
+    def reset():
+        api.products = list(products)
+        api._records = None
+
+    reset()
+    assert [product["id"] for product in api.select_covering_products(area)] == ["all"]
+    reset()
+    selected = api.select_covering_products(area, cost="size")
+    assert [product["id"] for product in selected] == ["left", "right"]
+    assert api.get_products() is selected
+    reset()
+    assert len(api.select_covering_products(area, cost="size", tolerance=0.6)) == 1
+    reset()
+    selected = api.select_covering_products(area, cost=lambda record: 1 if record.id != "all" else 100)
+    assert [product["id"] for product in selected] == ["left", "right"]
+    with pytest.raises(ValueError):
+        api.select_covering_products(area, cost="unknown")
+
+    # two products covering the whole area, the first one is taken if both cost the same
+    products = [
+        _opensearch_entry("old_cloudy", "POLYGON ((0 0,2 0,2 2,0 2,0 0))", cloudcoverpercentage="80"),
+        _opensearch_entry("new_clear", "POLYGON ((0 0,2 0,2 2,0 2,0 0))", cloudcoverpercentage="5")
+    ]
+    products[0]["date"] = [{"name": "beginposition", "content": "2017-01-01T10:00:00.000Z"}]
+    products[1]["date"] = [{"name": "beginposition", "content": "2017-03-01T10:00:00.000Z"}]
+    reset()
+    assert [product["id"] for product in api.select_covering_products(area)] == ["old_cloudy"]
+    reset()
+    assert [product["id"] for product in api.select_covering_products(area, cost="cloudcover")] == ["new_clear"]
+    reset()
+    assert [product["id"] for product in api.select_covering_products(area, cost="date")] == ["new_clear"]
+
+
+@pytest.mark.fast
+def test_to_dataframe():
+    pd = pytest.importorskip("pandas")
+    api = SentinelAPI("mock_user", "mock_password")
+    api.products = [
+        _opensearch_entry("a", "POLYGON ((0 0,1 0,1 1,0 0))", size="1.5 GB"),
+        _opensearch_entry("b", "POLYGON ((0 0,2 0,2 2,0 0))", size="512 MB")
+    ]
+    api.products[0]["int"] = [{"name": "orbitnumber", "content": "8701"}]
+    api.products[1]["int"] = [{"name": "orbitnumber", "content": "8702"}]
+    api.products[1]["double"] = [{"name": "cloudcoverpercentage", "content": "12.5"}]
+
+    df = api.to_dataframe()
+    assert list(df.index) == ["a", "b"]
+    assert list(df["size"]) == [1610612736, 536870912]
+    assert list(df["orbitnumber"]) == [8701, 8702]
+    assert df["orbitnumber"].dtype.kind == "i"
+    assert pd.isnull(df["cloudcoverpercentage"]["a"])
+    assert df["cloudcoverpercentage"]["b"] == 12.5
+    assert df["beginposition"]["a"] == pd.Timestamp("2015-12-24T09:40:34.129Z")
+    assert df["footprint"]["b"] == "POLYGON ((0 0,2 0,2 2,0 0))"
+
+
+@pytest.mark.fast
+def test_get_coordinates_tile():
+    assert get_coordinates(tile='33UUP') == '48.2416843,13.0456113'
+    centroids = get_tile_centroids(['33UUP', '01CCV'])
+    assert centroids['33UUP'] == (48.2416842864, 13.0456112959)
+    # tiles crossing the antimeridian: first centroid
+    assert centroids['01CCV'] == (-72.5432028895, 178.512103327)
+    with pytest.raises(ValueError):
+        get_tile_centroids(['33UUP', 'XXXXX'])
+
+
+@pytest.mark.fast
+def test_find_tiles():
+    assert find_tiles((13.0, 48.0, 13.2, 48.3)) == ['32UQU', '33UUP']
+    triangle = {"type": "Polygon", "coordinates": [[[13.0, 48.0], [13.2, 48.0], [13.0, 48.3], [13.0, 48.0]]]}
+    assert find_tiles(triangle) == ['32UQU', '33UUP']
+    assert find_tiles({"type": "Feature", "properties": {}, "geometry": triangle}) == ['32UQU', '33UUP']
+    # every tile found for a large area covers part of it
+    area = (5.0, 45.0, 15.0, 55.0)
+    tiles = find_tiles(area)
+    assert '33UUP' in tiles
+    for lat, lon in get_tile_centroids(tiles).values():
+        assert 44 < lat < 56 and 3 < lon < 17
+
+
+@pytest.mark.mock_api
+def test_query_split():
+    api = SentinelAPI("mock_user", "mock_password", page_size=2)
+    # one product per day, two on January 10th
+    dates = [datetime(2016, 1, 1, 12) + timedelta(days=i) for i in range(20)] + [datetime(2016, 1, 10, 18)]
+    queries = []
+
+    def search_response(request, context):
+        query = parse_qs(request.body)['q'][0]
+        queries.append(query)
+        start, end = [datetime.strptime(d, '%Y-%m-%dT%H:%M:%SZ')
+                      for d in query[len('(beginPosition:['):query.index('])')].split(' TO ')]
+        ids = [d.strftime('%Y%m%dT%H') for d in sorted(dates) if start <= d <= end]
+        offset = int(request.qs['start'][0])
+        return _opensearch_page(ids[offset:offset + 2], len(ids))
+
+    with requests_mock.mock() as rqst:
+        rqst.post(api.url, json=search_response)
+        api.query_split('0 0,1 1,0 1,0 0', initial_date=datetime(2016, 1, 1), end_date="20160121",
+                        window=timedelta(days=7), max_results=3, platformname="Sentinel-1")
+    assert [product["id"] for product in api.get_products()] == [d.strftime('%Y%m%dT%H') for d in sorted(dates)]
+    assert all(query.endswith('AND (platformname:Sentinel-1)') for query in queries)
+    assert api.last_query.startswith('(beginPosition:[2016-01-01T00:00:00Z TO 2016-01-21T00:00:00Z])')
+
+
+@pytest.mark.mock_api
+def test_query_incremental(tmpdir):
+    api = SentinelAPI("mock_user", "mock_password")
+    state_file = str(tmpdir.join("state.json"))
+    ingestion_dates = {"a": "2016-01-01T10:00:00.000Z", "b": "2016-01-01T11:00:00.000Z",
+                       "c": "2016-01-01T11:00:00.000Z"}
+
+    def search_response(request, context):
+        query = parse_qs(request.body)['q'][0]
+        since = query.split('ingestiondate:[')[1].split(' TO ')[0] if 'ingestiondate' in query else ''
+        ids = sorted(id for id, ingestion_date in ingestion_dates.items() if ingestion_date >= since)
+        entries = [_opensearch_entry(id, "POLYGON ((0 0,1 0,1 1,0 0))") for id in ids]
+        for entry in entries:
+            entry["date"].append({"name": "ingestiondate", "content": ingestion_dates[entry["id"]]})
+        return {"feed": {"opensearch:totalResults": str(len(entries)), "entry": entries}}
+
+    with requests_mock.mock() as rqst:
+        rqst.post(api.url, json=search_response)
+        api.query_incremental(state_file, area='0 0,1 1,0 1,0 0', initial_date='NOW-1DAY', end_date='NOW')
+        assert [product["id"] for product in api.get_products()] == ["a", "b", "c"]
+        assert "ingestiondate" not in rqst.last_request.text
+
+        api.query_incremental(state_file, area='0 0,1 1,0 1,0 0', initial_date='NOW-1DAY', end_date='NOW')
+        assert api.get_products() == []
+        assert "ingestiondate:[2016-01-01T11:00:00.000Z TO NOW]" in parse_qs(rqst.last_request.body)['q'][0]
+
+        ingestion_dates["d"] = "2016-01-01T11:00:00.000Z"
+        ingestion_dates["e"] = "2016-01-01T12:00:00.000Z"
+        api.query_incremental(state_file, area='0 0,1 1,0 1,0 0', initial_date='NOW-1DAY', end_date='NOW')
+        assert [product["id"] for product in api.get_products()] == ["d", "e"]
+        assert [feature["properties"]["product_id"] for feature in api.get_footprints()["features"]] == ["d", "e"]
+
+        # other queries have their own state
+        api.query_incremental(state_file, area='0 0,2 2,0 2,0 0', initial_date='NOW-1DAY', end_date='NOW')
+        assert len(api.get_products()) == 5
+
+        # the date range does not identify the query, the defaults are relative dates
+        api.query_incremental(state_file, area='0 0,1 1,0 1,0 0')
+        assert "beginPosition:[NOW-1DAY TO NOW]" in parse_qs(rqst.last_request.body)['q'][0]
+        assert api.get_products() == []
+        api.query_incremental(state_file, area='0 0,1 1,0 1,0 0', initial_date=datetime(2015, 12, 1))
+        assert api.get_products() == []
+
+        # the state is only saved once committed
+        ingestion_dates["f"] = "2016-01-01T13:00:00.000Z"
+        api.query_incremental(state_file, area='0 0,1 1,0 1,0 0', commit=False)
+        assert [product["id"] for product in api.get_products()] == ["f"]
+        api.query_incremental(state_file, area='0 0,1 1,0 1,0 0', commit=False)
+        assert [product["id"] for product in api.get_products()] == ["f"]
+        api.commit_incremental()
+        api.query_incremental(state_file, area='0 0,1 1,0 1,0 0')
+        assert api.get_products() == []
+
+
+@pytest.mark.mock_api
+def test_download_all_inventory(tmpdir, monkeypatch):
+    inventory = DownloadInventory(str(tmpdir.join("inventory.sqlite")))
+    api = SentinelAPI("mock_user", "mock_password", inventory=inventory)
+    api.products = [{"id": str(i), "title": "product_%d" % i} for i in range(3)]
+    content = b'sentinel' * 100
+    products_info = dict((str(i), {
+        "id": str(i), "title": "product_%d" % i, "size": len(content),
+        "md5": hashlib.md5(content).hexdigest(),
+        "url": "https://scihub.copernicus.eu/apihub/odata/v1/Products('%d')/$value" % i
+    }) for i in range(3))
+    monkeypatch.setattr(api, "get_products_info", lambda ids: dict((id, products_info[id]) for id in ids))
+    paths = [str(tmpdir.join("product_%d.zip" % i)) for i in range(3)]
+
+    # products 0 and 1 were downloaded without checking them, product 1 is corrupt
+    tmpdir.join("product_0.zip").write_binary(content)
+    tmpdir.join("product_1.zip").write_binary(b'x' * len(content))
+    inventory.add(paths[0], products_info["0"])
+    inventory.add(paths[1], products_info["1"])
+
+    # completed products are skipped without any request
+    products = api.products
+    api.products = products[:2]
+    with requests_mock.mock() as rqst:
+        result = api.download_all(str(tmpdir))
+        assert rqst.request_history == []
+    assert sorted(result) == paths[:2]
+
+    # unverified products are checked if checksums are requested, corrupt ones downloaded again
+    api.products = products
+    with requests_mock.mock() as rqst:
+        for i in range(3):
+            rqst.get(products_info[str(i)]["url"], content=content)
+        result = api.download_all(str(tmpdir), checksum=True)
+        assert sorted(request.url for request in rqst.request_history) == [
+            products_info["1"]["url"], products_info["2"]["url"]]
+    assert sorted(result) == paths
+    assert all(product_info is not None for product_info in result.values())
+    assert tmpdir.join("product_1.zip").read_binary() == content
+    assert all(verified for _, _, verified in inventory.get_many(["0", "1", "2"]).values())
+
+    # verified products are skipped on the next run
+    with requests_mock.mock() as rqst:
+        result = api.download_all(str(tmpdir), checksum=True)
+        assert rqst.request_history == []
+    assert sorted(result) == paths
+
+
+def _odata_product(id):
+    return {
+        "Id": id,
+        "Name": "product_%s" % id,
+        "ContentLength": "1000",
+        "Checksum": {"Value": "D5E4DF5C38C6E97BF7E7BD540AB21C05"},
+        "ContentDate": {"Start": "/Date(1445588544652)/"},
+        "ContentGeometry": '<gml:Polygon xmlns:gml="http://www.opengis.net/gml"><gml:outerBoundaryIs>'
+                           '<gml:LinearRing><gml:coordinates>0,0 0,1 1,1 0,0</gml:coordinates>'
+                           '</gml:LinearRing></gml:outerBoundaryIs></gml:Polygon>'
+    }
+
+
+@pytest.mark.mock_api
+def test_get_products_info():
+    api = SentinelAPI("mock_user", "mock_password")
+    ids = ["id%d" % i for i in range(5)]
+    product_url = "https://scihub.copernicus.eu/apihub/odata/v1/Products('%s')/?$format=json"
+    with requests_mock.mock() as rqst:
+        # "id4" is missing from the batch response
+        rqst.get("https://scihub.copernicus.eu/apihub/odata/v1/Products",
+                 json={"d": {"results": [_odata_product(id) for id in ids[:4]]}})
+        rqst.get(product_url % "id4", json={"d": _odata_product("id4")})
+        result = api.get_products_info(ids, batch_size=3)
+        assert sorted(result) == ids
+        assert result["id2"] == {
+            'id': 'id2', 'title': 'product_id2', 'size': 1000, 'md5': 'D5E4DF5C38C6E97BF7E7BD540AB21C05',
+            'date': '2015-10-23T08:22:24Z', 'footprint': '0 0,1 0,1 1,0 0',
+            'url': "https://scihub.copernicus.eu/apihub/odata/v1/Products('id2')/$value"
+        }
+        batch_requests = [r for r in rqst.request_history if "filter" in r.url]
+        assert len(batch_requests) == 2
+
+        # fall back to single requests if the batch request fails
+        rqst.get("https://scihub.copernicus.eu/apihub/odata/v1/Products", status_code=500)
+        for id in ids[:4]:
+            rqst.get(product_url % id, json={"d": _odata_product(id)})
+        assert api.get_products_info(ids) == result